@@ -0,0 +1,276 @@
+from argparse import ArgumentParser,Namespace
+from tempfile import mkdtemp
+from shutil import rmtree
+from json import dump
+from os import makedirs
+from os.path import join,dirname,abspath
+from pathlib import Path
+from time import time,sleep,monotonic
+from datetime import datetime
+from typing import List,Dict,Callable,NoReturn,Any,Optional,Tuple
+from statistics import quantiles
+from whatsapp import Whatsapp,WhatsappOptions,Message,LAUNCH_PROFILES,DEFAULT_PROFILE
+from whatsappwebbot import WhatsappWebBot
+from fake_telegram import FakeTelegram
+
+PAGE=Path(join(dirname(abspath(__file__)),'fake_whatsapp.html')).as_uri()
+DEFAULT_CHAT='default'
+ADMIN=1000
+TIMEOUT=120
+HISTORY_START=datetime(2020,1,20,12,0)
+ALBUM_SIZE=3
+
+def create_options(args:Namespace)->WhatsappOptions:
+    options:WhatsappOptions=WhatsappOptions()
+    options.url=PAGE
+    options.interactive=args.no_display
+    options.show=args.show
+    options.debug=args.debug
+    options.login_timeout=2
+    options.launch_profile=args.launch_profile
+    return options
+
+def wait_until(condition:Callable[[],bool],timeout:float=TIMEOUT)->NoReturn:
+    deadline:float=monotonic()+timeout
+    while not condition():
+        if monotonic()>deadline:
+            raise TimeoutError('Benchmark condition not met')
+        sleep(0.05)
+
+def inject(whatsapp:Whatsapp,chat:str,message:Dict[str,Any])->float:
+    sent:float=time()
+    whatsapp.driver.execute_script('fake.receive(arguments[0],arguments[1]);',chat,message)
+    return sent
+
+def report(name:str,latencies:List[float],elapsed:float)->NoReturn:
+    cuts:List[float]=quantiles(latencies,n=100,method='inclusive') if len(latencies)>1 else latencies*99
+    print(f'{name}: {len(latencies)} messages, {len(latencies)/elapsed:.1f} msg/s, '
+          f'p50 {cuts[49]*1000:.0f} ms, p99 {cuts[98]*1000:.0f} ms')
+
+def drain(whatsapp:Whatsapp,injected:Dict[str,float])->List[float]:
+    latencies:List[float]=[]
+    pending:Dict[str,float]=dict(injected)
+    deadline:float=monotonic()+TIMEOUT
+    while len(pending)>0:
+        if monotonic()>deadline:
+            raise TimeoutError(f'{len(pending)} messages were never read')
+        messages:List[Message]=whatsapp.get_unread_messages()
+        errors:Dict[str,Exception]=whatsapp.fetch_media([message.media for message in messages
+                                                         if message.media is not None])
+        if len(errors)>0:
+            raise next(iter(errors.values()))
+        received:float=time()
+        for message in messages:
+            if message.media is not None:
+                message.media.release()
+            text:str=message.text
+            if text in pending:
+                latencies.append(received-pending.pop(text))
+        sleep(0.05)
+    return latencies
+
+def start_session(args:Namespace,profile_dir:str)->Whatsapp:
+    whatsapp:Whatsapp=Whatsapp(profile_dir,DEFAULT_CHAT,create_options(args))
+    whatsapp.driver.execute_script('fake.addChat(arguments[0]);',DEFAULT_CHAT)
+    whatsapp.wait_for_login()
+    return whatsapp
+
+def unread_chats(args:Namespace,whatsapp:Whatsapp)->NoReturn:
+    injected:Dict[str,float]={}
+    for chat in range(args.chats):
+        for i in range(args.messages):
+            text:str=f'chat-{chat}-{i}'
+            injected[text]=inject(whatsapp,f'contact-{chat}',{'type':'text','text':text})
+    started:float=monotonic()
+    report('many unread chats',drain(whatsapp,injected),monotonic()-started)
+
+def group_burst(args:Namespace,whatsapp:Whatsapp)->NoReturn:
+    injected:Dict[str,float]={}
+    for i in range(args.chats*args.messages):
+        text:str=f'group-{i}'
+        injected[text]=inject(whatsapp,'group',{'type':'text','text':text,'sender':f'member-{i%7}'})
+    started:float=monotonic()
+    report('group burst',drain(whatsapp,injected),monotonic()-started)
+
+def media(args:Namespace,whatsapp:Whatsapp)->NoReturn:
+    injected:Dict[str,float]={}
+    for i in range(args.messages):
+        text:str=f'media-{i}'
+        injected[text]=inject(whatsapp,'media',{'type':'image','caption':text,'size':args.media_size})
+    started:float=monotonic()
+    report('media',drain(whatsapp,injected),monotonic()-started)
+
+def media_albums(args:Namespace,whatsapp:Whatsapp)->NoReturn:
+    whatsapp.driver.execute_script('fake.addChat(arguments[0]);','album')
+    latencies:List[float]=[]
+    expected:List[str]=[]
+    started:float=monotonic()
+    for i in range(args.messages):
+        photos:List[Tuple[bytes,str]]=[(bytes([i%256,j])*(args.media_size//2),f'album-{i}-{j}')
+                                       for j in range(ALBUM_SIZE)]
+        expected.extend(caption for _photo,caption in photos)
+        sent:float=time()
+        whatsapp.send_photos('album',photos)
+        latencies.append(time()-sent)
+    received:List[str]=[item['text'] for item in whatsapp.driver.execute_script('return fake.sent;')
+                        if item['chat']=='album' and item['type']=='image']
+    if received!=expected:
+        raise AssertionError(f'The albums arrived as {received}')
+    report('album',latencies,monotonic()-started)
+
+def history(args:Namespace,whatsapp:Whatsapp)->NoReturn:
+    count:int=args.history
+    start:float=HISTORY_START.timestamp()
+    whatsapp.driver.execute_script('fake.seed(arguments[0],arguments[1]);','history',
+                                   [{'type':'text','text':f'history-{i}','time':(start+i*60)*1000}
+                                    for i in range(count)])
+    started:float=monotonic()
+    texts:List[str]=[message.text for message in whatsapp.iter_messages('history',limit=count)]
+    elapsed:float=monotonic()-started
+    if texts!=[f'history-{i}' for i in reversed(range(count))]:
+        raise AssertionError(f'Only {len(texts)} of {count} history messages were read in order')
+    since:int=count//2
+    texts=[message.text for message in
+           whatsapp.iter_messages('history',since=datetime.fromtimestamp(start+since*60))]
+    if len(texts)!=count-since:
+        raise AssertionError(f'Reading since a time returned {len(texts)} messages instead of {count-since}')
+    print(f'history: {count} messages, {count/elapsed:.1f} msg/s, {elapsed:.1f}s')
+
+def start_bot(args:Namespace,data_dir:str,users:List[int],telegram:FakeTelegram)->WhatsappWebBot:
+    makedirs(data_dir,exist_ok=True)
+    with open(join(data_dir,'data.json'),'w') as f:
+        dump({'users':[{'username':user,'default_chat_id':user,'associations':{},'default_chat':DEFAULT_CHAT}
+                       for user in users]},f)
+    options:WhatsappOptions=create_options(args)
+    options.telegram_api_url=telegram.base_url
+    bot:WhatsappWebBot=WhatsappWebBot(options,'TOKEN',data_dir,ADMIN,None,True)
+    bot.async_start('bot')
+    try:
+        wait_until(lambda:all(user.session is not None and user.session.logged_in for user in bot.users))
+        for user in bot.users:
+            user.session.driver.execute_script('fake.addChat(arguments[0]);',DEFAULT_CHAT)
+    except Exception:
+        bot.stop()
+        raise
+    return bot
+
+def many_users(args:Namespace,data_dir:str)->NoReturn:
+    telegram:FakeTelegram=FakeTelegram()
+    users:List[int]=[ADMIN+i for i in range(args.users)]
+    try:
+        bot:WhatsappWebBot=start_bot(args,data_dir,users,telegram)
+        try:
+            forward_and_reply(args,bot,users,telegram)
+        finally:
+            bot.stop()
+    finally:
+        telegram.close()
+
+def forward_and_reply(args:Namespace,bot:WhatsappWebBot,users:List[int],telegram:FakeTelegram)->NoReturn:
+    injected:Dict[str,float]={}
+    started:float=monotonic()
+    for i in range(args.messages):
+        for user in bot.users:
+            text:str=f'forward-{user.username}-{i}'
+            injected[text]=inject(user.session,f'contact-{i%args.chats}',{'type':'text','text':text})
+    latencies:List[float]=[]
+    for text,sent in injected.items():
+        received=telegram.wait_for(text,TIMEOUT)
+        if received is None:
+            raise TimeoutError(f'Message {text} was never forwarded to telegram')
+        latencies.append(received.time-sent)
+    report('whatsapp to telegram',latencies,monotonic()-started)
+
+    pushed:Dict[str,float]={}
+    started=monotonic()
+    for i in range(args.messages):
+        for user in users:
+            text:str=f'reply-{user}-{i}'
+            pushed[text]=time()
+            telegram.push_text(user,user,f'contact-{i%args.chats} {text}')
+    latencies=[]
+    for user in bot.users:
+        def delivered()->bool:
+            return all(text in sent for text in pushed if text.startswith(f'reply-{user.username}-'))
+        sent:Dict[str,float]={}
+        deadline:float=monotonic()+TIMEOUT
+        while not delivered():
+            if monotonic()>deadline:
+                raise TimeoutError(f'Messages of user {user.username} were never sent to whatsapp')
+            for item in user.session.driver.execute_script('return fake.sent;'):
+                sent[item['text']]=item['time']/1000
+            sleep(0.1)
+        latencies.extend(sent[text]-pushed[text] for text in pushed if text in sent)
+    report('telegram to whatsapp',latencies,monotonic()-started)
+
+def broadcast(args:Namespace,data_dir:str)->NoReturn:
+    telegram:FakeTelegram=FakeTelegram()
+    try:
+        bot:WhatsappWebBot=start_bot(args,data_dir,[ADMIN],telegram)
+        try:
+            session:Whatsapp=bot.users.find(ADMIN).session
+            recipients:List[str]=[f'contact-{i}' for i in range(args.chats)]
+            for recipient in recipients:
+                session.driver.execute_script('fake.addChat(arguments[0]);',recipient)
+            started:float=monotonic()
+            pushed:float=time()
+            telegram.push_text(ADMIN,ADMIN,'/broadcast')
+            telegram.push_text(ADMIN,ADMIN,','.join(recipients+['nobody'])+'\nbroadcast-text')
+            summary=telegram.wait_for('Broadcast to',TIMEOUT)
+            if summary is None:
+                raise TimeoutError('The broadcast never reported its result')
+            if f'{len(recipients)} sent, 1 failed' not in summary.text:
+                raise AssertionError(f'Unexpected broadcast result {summary.text}')
+            sent:Dict[str,float]={item['chat']:item['time']/1000
+                                  for item in session.driver.execute_script('return fake.sent;')
+                                  if item['text']=='broadcast-text'}
+            if sorted(sent)!=sorted(recipients):
+                raise AssertionError(f'The broadcast reached {sorted(sent)}')
+            report('broadcast',[at-pushed for at in sent.values()],monotonic()-started)
+        finally:
+            bot.stop()
+    finally:
+        telegram.close()
+
+SCENARIOS:Dict[str,Callable[[Namespace,Whatsapp],NoReturn]]={'unread':unread_chats,'group':group_burst,'media':media,
+                                                              'album':media_albums,'history':history}
+BOT_SCENARIOS:Dict[str,Callable[[Namespace,str],NoReturn]]={'users':many_users,'broadcast':broadcast}
+
+def main()->NoReturn:
+    parser:ArgumentParser=ArgumentParser(description='Offline benchmark against a fake whatsapp web page')
+    parser.add_argument('scenarios',nargs='*',default=list(SCENARIOS.keys())+list(BOT_SCENARIOS.keys()),
+                        choices=list(SCENARIOS.keys())+list(BOT_SCENARIOS.keys()))
+    parser.add_argument('--chats',type=int,default=10,help='Number of chats that receive messages')
+    parser.add_argument('--messages',type=int,default=5,help='Messages per chat, per media scenario or per user')
+    parser.add_argument('--users',type=int,default=3,help='Number of bot users')
+    parser.add_argument('--history',type=int,default=300,help='Messages in the history scenario')
+    parser.add_argument('--media-size',type=int,default=256*1024,help='Size in bytes of every media message')
+    parser.add_argument('-s','--show',action='store_true',default=False,help='Shows the chrome windows')
+    parser.add_argument('-i','--no-display',action='store_true',default=False,
+                        help='Do not start a virtual display')
+    parser.add_argument('--launch-profile',type=str,default=DEFAULT_PROFILE,choices=list(LAUNCH_PROFILES.keys()))
+    parser.add_argument('-d','--debug',action='store_true',default=False)
+    args:Namespace=parser.parse_args()
+    data_dir:str=mkdtemp(prefix='whatsappwebbot-benchmark-')
+    try:
+        scenarios:List[str]=[scenario for scenario in args.scenarios if scenario in SCENARIOS]
+        if len(scenarios)>0:
+            whatsapp:Optional[Whatsapp]=None
+            try:
+                started:float=monotonic()
+                whatsapp=start_session(args,join(data_dir,'session'))
+                print(f'session started in {monotonic()-started:.1f}s with the {args.launch_profile} profile, '
+                      +', '.join(f'{key} {value//1024//1024} MB' for key,value in whatsapp.memory_usage().items()))
+                for scenario in scenarios:
+                    SCENARIOS[scenario](args,whatsapp)
+            finally:
+                if whatsapp is not None:
+                    whatsapp.close()
+        for scenario in args.scenarios:
+            if scenario in BOT_SCENARIOS:
+                BOT_SCENARIOS[scenario](args,join(data_dir,scenario))
+    finally:
+        rmtree(data_dir,ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
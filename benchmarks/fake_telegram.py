@@ -0,0 +1,122 @@
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from threading import Thread,Condition
+from typing import Dict,Any,List,NoReturn,Optional,Tuple,Type
+from email.parser import BytesParser
+from email.policy import HTTP
+from json import loads,dumps
+from time import time,monotonic
+
+BOT_ID=1
+LOCALHOST='127.0.0.1'
+
+class Sent:
+    def __init__(self,method:str,chat_id:int,text:str):
+        self.method:str=method
+        self.chat_id:int=chat_id
+        self.text:str=text
+        self.time:float=time()
+
+class FakeTelegram:
+    def __init__(self,port:int=0):
+        self.sent:List[Sent]=[]
+        self._updates:List[Dict[str,Any]]=[]
+        self._next_update:int=1
+        self._next_message:int=1
+        self._condition:Condition=Condition()
+        self.server:ThreadingHTTPServer=ThreadingHTTPServer((LOCALHOST,port),_create_handler(self))
+        self._thread:Thread=Thread(target=self.server.serve_forever,name='fake-telegram',daemon=True)
+        self._thread.start()
+
+    base_url:str=property(lambda self:f'http://{LOCALHOST}:{self.server.server_address[1]}/bot')
+
+    def push_text(self,user_id:int,chat_id:int,text:str)->NoReturn:
+        with self._condition:
+            self._updates.append({'update_id':self._next_update,'message':self._message(chat_id,text,user_id)})
+            self._next_update+=1
+            self._condition.notify_all()
+
+    def wait_for(self,text:str,timeout:float)->Optional[Sent]:
+        deadline:float=monotonic()+timeout
+        with self._condition:
+            while True:
+                for sent in self.sent:
+                    if text in sent.text:
+                        return sent
+                remaining:float=deadline-monotonic()
+                if remaining<=0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _message(self,chat_id:int,text:str,user_id:int=BOT_ID)->Dict[str,Any]:
+        message:Dict[str,Any]={'message_id':self._next_message,'date':int(time()),'text':text,
+                               'chat':{'id':chat_id,'type':'private' if chat_id>0 else 'group'},
+                               'from':{'id':user_id,'is_bot':user_id==BOT_ID,'first_name':f'user{user_id}'}}
+        if text.startswith('/'):
+            message['entities']=[{'type':'bot_command','offset':0,'length':len(text.split()[0])}]
+        self._next_message+=1
+        return message
+
+    def call(self,method:str,data:Dict[str,Any])->Any:
+        if method=='getMe':
+            return {'id':BOT_ID,'is_bot':True,'first_name':'bot','username':'fake_bot'}
+        if method in ('deleteWebhook','setWebhook'):
+            return True
+        if method=='getUpdates':
+            offset:int=int(data.get('offset') or 0)
+            deadline:float=monotonic()+float(data.get('timeout') or 0)
+            with self._condition:
+                while True:
+                    self._updates=[update for update in self._updates if update['update_id']>=offset]
+                    remaining:float=deadline-monotonic()
+                    if len(self._updates)>0 or remaining<=0:
+                        return list(self._updates)
+                    self._condition.wait(remaining)
+        if method in ('sendMessage','sendPhoto','sendAudio'):
+            chat_id:int=int(data['chat_id'])
+            text:str=str(data.get('text',data.get('caption','')))
+            with self._condition:
+                self.sent.append(Sent(method,chat_id,text))
+                message:Dict[str,Any]=self._message(chat_id,text)
+                self._condition.notify_all()
+            return message
+        raise KeyError(method)
+
+    def close(self)->NoReturn:
+        self.server.shutdown()
+        self.server.server_close()
+
+def _parse(content_type:str,body:bytes)->Dict[str,Any]:
+    if content_type.startswith('application/json'):
+        return loads(body or b'{}')
+    if content_type.startswith('multipart/form-data'):
+        message=BytesParser(policy=HTTP).parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode()+body)
+        result:Dict[str,Any]={}
+        for part in message.iter_parts():
+            if part.get_filename() is None:
+                result[part.get_param('name',header='content-disposition')]=part.get_content()
+        return result
+    return {}
+
+def _create_handler(telegram:FakeTelegram)->Type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body:bytes=self.rfile.read(int(self.headers.get('Content-Length',0)))
+            method:str=self.path.rsplit('/',1)[-1]
+            response:Tuple[int,Dict[str,Any]]
+            try:
+                response=200,{'ok':True,'result':telegram.call(method,_parse(self.headers.get('Content-Type',''),
+                                                                                body))}
+            except KeyError:
+                response=404,{'ok':False,'error_code':404,'description':f'Method {method} not found'}
+            data:bytes=dumps(response[1]).encode()
+            self.send_response(response[0])
+            self.send_header('Content-Type','application/json')
+            self.send_header('Content-Length',str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET=do_POST
+
+        def log_message(self,format:str,*args)->NoReturn:
+            pass
+    return Handler
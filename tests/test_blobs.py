@@ -0,0 +1,31 @@
+from unittest import TestCase,main
+from whatsapp._blobs import BlobCache
+
+class BlobCacheCase(TestCase):
+    def test_eviction(self):
+        cache:BlobCache=BlobCache(10)
+        cache.put('a',b'1234')
+        cache.put('b',b'1234')
+        self.assertEqual(cache.get('a'),b'1234')
+        cache.put('c',b'1234')
+        self.assertIn('a',cache)
+        self.assertNotIn('b',cache)
+        self.assertIn('c',cache)
+        self.assertEqual(cache.size,8)
+
+    def test_replace(self):
+        cache:BlobCache=BlobCache(10)
+        cache.put('a',b'1234')
+        cache.put('a',b'12')
+        self.assertEqual(cache.get('a'),b'12')
+        self.assertEqual(cache.size,2)
+        self.assertEqual(len(cache),1)
+
+    def test_too_large(self):
+        cache:BlobCache=BlobCache(3)
+        cache.put('a',b'1234')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.size,0)
+
+if __name__ == '__main__':
+    main()
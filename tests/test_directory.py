@@ -0,0 +1,43 @@
+from unittest import TestCase,main
+from whatsapp import ContactDirectory
+
+class DirectoryCase(TestCase):
+    def test_exact_match(self):
+        directory:ContactDirectory=ContactDirectory(300)
+        directory.refresh(['Alice','Bob Smith'])
+        self.assertIn('Alice',directory)
+        self.assertIn('Bob Smith',directory)
+        self.assertNotIn('Bob',directory)
+        self.assertNotIn('alice',directory)
+        self.assertEqual(len(directory),2)
+
+    def test_ignore_case(self):
+        directory:ContactDirectory=ContactDirectory(300,True)
+        directory.refresh(['Alice'])
+        directory.add('BOB')
+        self.assertIn('alice',directory)
+        self.assertIn('Bob',directory)
+        self.assertNotIn('Ali',directory)
+
+    def test_missing(self):
+        directory:ContactDirectory=ContactDirectory(300)
+        self.assertTrue(directory.stale)
+        directory.add_missing('Carol')
+        self.assertTrue(directory.missing('Carol'))
+        directory.add('Carol')
+        self.assertFalse(directory.missing('Carol'))
+        self.assertIn('Carol',directory)
+        directory.add_missing('Dave')
+        directory.refresh([])
+        self.assertFalse(directory.stale)
+        self.assertFalse(directory.missing('Dave'))
+
+    def test_ttl(self):
+        directory:ContactDirectory=ContactDirectory(0)
+        directory.refresh(['Alice'])
+        directory.add_missing('Bob')
+        self.assertTrue(directory.stale)
+        self.assertFalse(directory.missing('Bob'))
+
+if __name__ == '__main__':
+    main()
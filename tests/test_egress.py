@@ -0,0 +1,20 @@
+from unittest import TestCase,main
+from time import sleep
+from whatsappwebbot.egress import TokenBucket
+
+class TokenBucketCase(TestCase):
+    def test_burst(self):
+        bucket:TokenBucket=TokenBucket(1,3)
+        self.assertEqual([bucket.reserve() for _ in range(3)],[0,0,0])
+        self.assertAlmostEqual(bucket.reserve(),1,places=1)
+        self.assertAlmostEqual(bucket.reserve(),2,places=1)
+
+    def test_refill(self):
+        bucket:TokenBucket=TokenBucket(100,1)
+        bucket.reserve()
+        bucket.acquire()
+        sleep(0.05)
+        self.assertEqual(bucket.reserve(),0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+from unittest import TestCase,main
+from logging import getLogger,Logger,DEBUG,INFO,WARNING
+from whatsappwebbot.logs import LogRing,USER
+
+class LogRingCase(TestCase):
+    def setUp(self):
+        self.ring:LogRing=LogRing(5)
+        self.logger:Logger=getLogger('test-logs')
+        self.logger.setLevel(DEBUG)
+        self.logger.propagate=False
+        self.ring.attach(self.logger)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.ring)
+
+    def test_capacity(self):
+        for i in range(8):
+            self.logger.info(f'message {i}')
+        self.assertEqual(len(self.ring),5)
+        self.assertEqual([entry.message for entry in self.ring.query()],[f'message {i}' for i in range(3,8)])
+
+    def test_filter(self):
+        self.logger.debug('debug')
+        self.logger.warning('warning',extra={USER:42})
+        self.logger.info('info',extra={USER:7})
+        self.assertEqual([entry.message for entry in self.ring.query(INFO)],['warning','info'])
+        self.assertEqual([entry.message for entry in self.ring.query(user=42)],['warning'])
+        self.assertEqual(self.ring.query(WARNING,7),[])
+
+    def test_pages(self):
+        for i in range(5):
+            self.logger.info(f'message {i}'+'x'*40)
+        pages=self.ring.pages(size=200)
+        self.assertEqual(len(pages),3)
+        self.assertTrue(pages[0].startswith('Page 1/3\n'))
+        self.assertIn('message 4',pages[0])
+        self.assertIn('message 3',pages[0])
+        self.assertNotIn('message 2',pages[0])
+        self.assertIn('message 0',pages[2])
+        self.assertLess(pages[0].index('message 3'),pages[0].index('message 4'))
+        for page in pages:
+            self.assertLessEqual(len(page),200)
+
+    def test_no_pages(self):
+        self.assertEqual(self.ring.pages(),[])
+
+if __name__ == '__main__':
+    main()
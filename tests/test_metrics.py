@@ -0,0 +1,47 @@
+from unittest import TestCase,main
+from whatsapp import Metrics,Histogram
+
+class HistogramCase(TestCase):
+    def test_quantile(self):
+        histogram:Histogram=Histogram()
+        for value in [0.001,0.02,0.02,0.3,100]:
+            histogram.observe(value)
+        self.assertEqual(histogram.count,5)
+        self.assertAlmostEqual(histogram.sum,100.341)
+        self.assertEqual(histogram.quantile(0.2),0.005)
+        self.assertEqual(histogram.quantile(0.5),0.025)
+        self.assertEqual(histogram.quantile(0.8),0.5)
+        self.assertEqual(histogram.quantile(1),float('inf'))
+        self.assertEqual(Histogram().quantile(0.5),0)
+
+    def test_merge(self):
+        first:Histogram=Histogram()
+        first.observe(0.01)
+        second:Histogram=Histogram()
+        second.observe(1)
+        first.merge(second)
+        self.assertEqual(first.count,2)
+        self.assertEqual(first.quantile(1),1)
+
+class MetricsCase(TestCase):
+    def test_group(self):
+        metrics:Metrics=Metrics()
+        metrics.observe('poll','1',0.1)
+        metrics.observe('poll','2',0.2)
+        metrics.observe('send','1',1)
+        self.assertEqual(metrics.by_operation()['poll'].count,2)
+        self.assertEqual(sorted(metrics.by_user('poll')),['1','2'])
+        with metrics.time('send','2'):
+            pass
+        self.assertEqual(metrics.by_operation()['send'].count,2)
+
+    def test_prometheus(self):
+        metrics:Metrics=Metrics()
+        metrics.observe('poll','1',0.1)
+        text:str=metrics.prometheus()
+        self.assertIn('whatsappwebbot_operation_seconds_bucket{operation="poll",user="1",le="0.1"} 1',text)
+        self.assertIn('whatsappwebbot_operation_seconds_bucket{operation="poll",user="1",le="+Inf"} 1',text)
+        self.assertIn('whatsappwebbot_operation_seconds_count{operation="poll",user="1"} 1',text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+from unittest import TestCase,main
+from tempfile import mkdtemp
+from shutil import rmtree
+from os import makedirs,listdir
+from os.path import join,exists,dirname
+from tarfile import TarInfo
+from tarfile import open as open_tar
+from io import BytesIO
+from whatsapp import profile_size,compact_profile,snapshot_profile,restore_profile,remove_snapshot
+
+def write(path:str,data:bytes):
+    makedirs(dirname(path),exist_ok=True)
+    with open(path,'wb') as f:
+        f.write(data)
+
+class ProfileCase(TestCase):
+    def setUp(self):
+        self.directory:str=mkdtemp()
+        self.profile:str=join(self.directory,'1')
+        self.snapshot:str=join(self.directory,'snapshots','1.tar.gz')
+        write(join(self.profile,'Default','Cookies'),b'cookies')
+        write(join(self.profile,'Default','Cache','data'),b'0'*100)
+        write(join(self.profile,'SingletonLock'),b'lock')
+
+    def tearDown(self):
+        rmtree(self.directory,ignore_errors=True)
+
+    def test_compact(self):
+        self.assertEqual(profile_size(self.profile),111)
+        self.assertEqual(compact_profile(self.profile),100)
+        self.assertTrue(exists(join(self.profile,'Default','Cookies')))
+        self.assertFalse(exists(join(self.profile,'Default','Cache')))
+
+    def test_snapshot_restore(self):
+        self.assertGreater(snapshot_profile(self.profile,self.snapshot),0)
+        write(join(self.profile,'Default','Cookies'),b'changed')
+        write(join(self.profile,'Default','History'),b'history')
+        restore_profile(self.snapshot,self.profile)
+        with open(join(self.profile,'Default','Cookies'),'rb') as f:
+            self.assertEqual(f.read(),b'cookies')
+        self.assertFalse(exists(join(self.profile,'Default','History')))
+        self.assertFalse(exists(join(self.profile,'Default','Cache')))
+        self.assertFalse(exists(join(self.profile,'SingletonLock')))
+        self.assertEqual(sorted(listdir(self.directory)),['1','snapshots'])
+
+    def test_restore_unsafe(self):
+        makedirs(join(self.directory,'snapshots'))
+        with open_tar(self.snapshot,'w:gz') as tar:
+            info:TarInfo=TarInfo('profile/../../escape')
+            info.size=4
+            tar.addfile(info,BytesIO(b'evil'))
+        with self.assertRaises(ValueError):
+            restore_profile(self.snapshot,self.profile)
+        self.assertTrue(exists(join(self.profile,'Default','Cookies')))
+        self.assertFalse(exists(join(self.directory,'..','escape')))
+
+    def test_remove_snapshot(self):
+        snapshot_profile(self.profile,self.snapshot)
+        remove_snapshot(self.snapshot)
+        self.assertFalse(exists(self.snapshot))
+        remove_snapshot(self.snapshot)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+from unittest import TestCase,main
+from logging import getLogger
+from typing import Dict,Any,List,Optional
+from tempfile import mkdtemp
+from shutil import rmtree
+from whatsappwebbot.registry import Registry
+from whatsappwebbot.storage import Storage
+from whatsappwebbot.error import AssociationConflictError,NoSuchUserError
+from whatsappwebbot.user import USERNAME,DEFAULT_CHAT_ID,ASSOCIATIONS,DEFAULT_CHAT,LAST_ACTIVE
+
+class FakeUser:
+    def __init__(self,username:int,associations:Optional[Dict[str,int]]=None):
+        self.username:int=username
+        self.default_chat_id:int=username
+        self.associations:Dict[str,int]={} if associations is None else associations
+        self.default_chat:str='default'
+
+    def as_dict(self)->Dict[str,Any]:
+        return {USERNAME:self.username,DEFAULT_CHAT_ID:self.default_chat_id,ASSOCIATIONS:dict(self.associations),
+                DEFAULT_CHAT:self.default_chat,LAST_ACTIVE:0}
+
+class RecordingStorage:
+    def __init__(self):
+        self.records:List[tuple]=[]
+
+    def user_added(self,user:Dict[str,Any]):
+        self.records.append(('user_added',user[USERNAME]))
+
+    def user_deleted(self,username:int):
+        self.records.append(('user_deleted',username))
+
+    def association_set(self,username:int,who:str,chat_id:int):
+        self.records.append(('association_set',username,who,chat_id))
+
+    def default_chat_changed(self,username:int,default_chat:str):
+        self.records.append(('default_chat_changed',username,default_chat))
+
+class RegistryCase(TestCase):
+    def setUp(self):
+        self.registry:Registry=Registry(getLogger('test'))
+
+    def test_find(self):
+        user:FakeUser=FakeUser(1)
+        self.registry.add(user)
+        self.assertIs(self.registry.find(1),user)
+        self.assertIn(1,self.registry)
+        self.assertRaises(NoSuchUserError,self.registry.find,2)
+
+    def test_add_twice(self):
+        self.registry.add(FakeUser(1))
+        self.assertRaises(ValueError,self.registry.add,FakeUser(1))
+
+    def test_contact(self):
+        user:FakeUser=FakeUser(1,{'alice':-10})
+        self.registry.add(user)
+        self.assertEqual(self.registry.contact(user,-10),'alice')
+        self.assertIsNone(self.registry.contact(user,1))
+        self.assertEqual(self.registry.find_chat(-10),(user,'alice'))
+
+    def test_second_contact_keeps_first_association(self):
+        user:FakeUser=FakeUser(1)
+        self.registry.add(user)
+        self.registry.associate(user,'alice',-10)
+        self.registry.associate(user,'bob',-10)
+        self.assertEqual(user.associations,{'alice':-10,'bob':-10})
+        self.assertEqual(self.registry.contact(user,-10),'bob')
+
+    def test_move_association(self):
+        user:FakeUser=FakeUser(1)
+        self.registry.add(user)
+        self.registry.associate(user,'alice',-10)
+        self.registry.associate(user,'bob',-10)
+        self.registry.associate(user,'bob',-20)
+        self.assertEqual(self.registry.contact(user,-10),'alice')
+        self.assertEqual(self.registry.contact(user,-20),'bob')
+        self.registry.associate(user,'alice',-30)
+        self.assertIsNone(self.registry.find_chat(-10))
+
+    def test_move_default_chat_association(self):
+        user:FakeUser=FakeUser(1)
+        self.registry.add(user)
+        self.registry.associate(user,'alice',1)
+        self.registry.associate(user,'alice',-10)
+        self.assertEqual(self.registry.find_chat(1),(user,None))
+
+    def test_conflict_is_rejected(self):
+        first:FakeUser=FakeUser(1)
+        second:FakeUser=FakeUser(2)
+        self.registry.add(first)
+        self.registry.add(second)
+        self.registry.associate(first,'alice',-10)
+        self.assertRaises(AssociationConflictError,self.registry.associate,second,'bob',-10)
+        self.assertRaises(AssociationConflictError,self.registry.associate,second,'bob',1)
+        self.assertEqual(second.associations,{})
+
+    def test_conflicting_data_is_loaded_unchanged(self):
+        first:FakeUser=FakeUser(1,{'alice':-10})
+        second:FakeUser=FakeUser(2,{'bob':-10,'carol':-20})
+        self.registry.add(first)
+        with self.assertLogs('test','WARNING'):
+            self.registry.add(second)
+        self.assertEqual(second.associations,{'bob':-10,'carol':-20})
+        self.assertEqual(self.registry.find_chat(-10),(first,'alice'))
+        self.assertEqual(self.registry.find_chat(-20),(second,'carol'))
+        self.registry.remove(first)
+        self.assertEqual(self.registry.find_chat(-10),(second,'bob'))
+
+    def test_remove(self):
+        user:FakeUser=FakeUser(1,{'alice':-10})
+        self.registry.add(user)
+        self.registry.remove(user)
+        self.assertNotIn(1,self.registry)
+        self.assertIsNone(self.registry.find_chat(-10))
+        self.assertIsNone(self.registry.find_chat(1))
+
+    def test_records(self):
+        storage:RecordingStorage=RecordingStorage()
+        self.registry.storage=storage
+        user:FakeUser=FakeUser(1)
+        self.registry.add(user)
+        self.registry.associate(user,'alice',-10)
+        self.registry.default_chat_changed(user)
+        self.registry.remove(user)
+        self.assertEqual(storage.records,[('user_added',1),('association_set',1,'alice',-10),
+                                          ('default_chat_changed',1,'default'),('user_deleted',1)])
+
+    def test_compact(self):
+        data_dir:str=mkdtemp()
+        try:
+            storage:Storage=Storage(data_dir,100,3600,getLogger('test'))
+            self.registry.storage=storage
+            user:FakeUser=FakeUser(1)
+            self.registry.add(user)
+            self.registry.associate(user,'alice',-10)
+            self.registry.compact(storage)
+            self.registry.associate(user,'bob',-10)
+            storage.close()
+            self.assertEqual(Storage(data_dir,100,3600,getLogger('test')).load()[0][ASSOCIATIONS],
+                             {'alice':-10,'bob':-10})
+        finally:
+            rmtree(data_dir)
+
+if __name__ == '__main__':
+    main()
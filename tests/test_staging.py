@@ -0,0 +1,50 @@
+from unittest import TestCase,main
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import exists,dirname
+from whatsapp import MediaStaging
+
+class StagingCase(TestCase):
+    def setUp(self):
+        self.directory:str=mkdtemp()
+        self.staging:MediaStaging=MediaStaging(self.directory,ttl=0,cleanup_interval=3600)
+
+    def tearDown(self):
+        self.staging.close()
+        rmtree(self.directory,ignore_errors=True)
+
+    def test_deduplicate(self):
+        first:str=self.staging.stage(b'photo','.png')
+        second:str=self.staging.stage_stream(lambda f:f.write(b'photo'),'.png')
+        self.assertEqual(first,second)
+        self.assertTrue(first.endswith('.png'))
+        self.assertEqual(dirname(first),self.staging.directory)
+        with open(first,'rb') as f:
+            self.assertEqual(f.read(),b'photo')
+        self.assertEqual(len(self.staging),1)
+
+    def test_cleanup_released(self):
+        path:str=self.staging.stage(b'photo')
+        self.staging.stage(b'photo')
+        self.staging.release(path)
+        self.assertEqual(self.staging.cleanup(),0)
+        self.assertTrue(exists(path))
+        self.staging.release(path)
+        self.assertEqual(self.staging.cleanup(),1)
+        self.assertFalse(exists(path))
+
+    def test_failed_download(self):
+        def download(f):
+            f.write(b'partial')
+            raise IOError('broken')
+        with self.assertRaises(IOError):
+            self.staging.stage_stream(download)
+        self.assertEqual(len(self.staging),0)
+
+    def test_close(self):
+        self.staging.stage(b'photo')
+        self.staging.close()
+        self.assertFalse(exists(self.staging.directory))
+
+if __name__ == '__main__':
+    main()
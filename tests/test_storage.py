@@ -0,0 +1,98 @@
+from unittest import TestCase,main
+from logging import getLogger
+from tempfile import mkdtemp
+from shutil import rmtree
+from os import listdir
+from threading import Thread,Event
+from typing import Dict,Any,List
+from whatsappwebbot.storage import Storage
+from whatsappwebbot.user import USERNAME,DEFAULT_CHAT_ID,ASSOCIATIONS,DEFAULT_CHAT
+
+def user(username:int,associations:Dict[str,int]=None)->Dict[str,Any]:
+    return {USERNAME:username,DEFAULT_CHAT_ID:username,ASSOCIATIONS:{} if associations is None else associations,
+            DEFAULT_CHAT:'default'}
+
+class StorageCase(TestCase):
+    def setUp(self):
+        self.data_dir:str=mkdtemp()
+        self.storage:Storage=Storage(self.data_dir,3,3600,getLogger('test'))
+
+    def tearDown(self):
+        self.storage.close()
+        rmtree(self.data_dir)
+
+    def reload(self)->List[Dict[str,Any]]:
+        self.storage.close()
+        self.storage=Storage(self.data_dir,3,3600,getLogger('test'))
+        return self.storage.load()
+
+    def test_empty(self):
+        self.assertEqual(self.storage.load(),[])
+
+    def test_journal_replay(self):
+        self.storage.user_added(user(1))
+        self.storage.user_added(user(2))
+        self.storage.association_set(1,'alice',-10)
+        self.storage.association_set(1,'bob',-10)
+        self.storage.default_chat_changed(1,'group')
+        self.storage.user_deleted(2)
+        self.assertEqual(self.reload(),[{USERNAME:1,DEFAULT_CHAT_ID:1,ASSOCIATIONS:{'alice':-10,'bob':-10},
+                                         DEFAULT_CHAT:'group'}])
+
+    def test_truncated_entry(self):
+        self.storage.user_added(user(1))
+        self.storage.close()
+        with open(self.storage.journal_file,'a') as f:
+            f.write('{"type": "user_added", "us')
+        self.assertEqual([entry[USERNAME] for entry in self.reload()],[1])
+
+    def test_due(self):
+        self.assertFalse(self.storage.due)
+        for username in range(3):
+            self.storage.user_added(user(username))
+        self.assertTrue(self.storage.due)
+        self.storage.compact(lambda:[user(username) for username in range(3)])
+        self.assertFalse(self.storage.due)
+
+    def test_compact(self):
+        self.storage.user_added(user(1))
+        self.storage.association_set(1,'alice',-10)
+        self.storage.compact(lambda:[user(1,{'alice':-10})])
+        with open(self.storage.journal_file) as f:
+            self.assertEqual(f.read(),'')
+        self.storage.association_set(1,'bob',-20)
+        self.assertEqual(self.reload(),[user(1,{'alice':-10,'bob':-20})])
+
+    def test_failed_compaction_keeps_the_journal(self):
+        for username in range(3):
+            self.storage.user_added(user(username))
+        with self.assertRaises(TypeError):
+            self.storage.compact(lambda:[object()])
+        self.assertFalse(self.storage.due)
+        self.assertEqual(listdir(self.data_dir),['data.journal'])
+        self.assertEqual(self.reload(),[user(username) for username in range(3)])
+
+    def test_record_during_compaction_is_kept(self):
+        self.storage.user_added(user(1))
+        building:Event=Event()
+        release:Event=Event()
+
+        def snapshot()->List[Dict[str,Any]]:
+            building.set()
+            release.wait(5)
+            return [user(1)]
+
+        compaction:Thread=Thread(target=self.storage.compact,args=(snapshot,))
+        compaction.start()
+        building.wait(5)
+        writer:Thread=Thread(target=self.storage.association_set,args=(1,'alice',-10))
+        writer.start()
+        writer.join(0.2)
+        self.assertTrue(writer.is_alive())
+        release.set()
+        compaction.join()
+        writer.join()
+        self.assertEqual(self.reload(),[user(1,{'alice':-10})])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+from unittest import TestCase,main
+from datetime import datetime
+from whatsapp._whatsapp import parse_time,detect_time_format,guess_time
+
+class TimeCase(TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_time('[10:32, 18/10/2026] Alice: ','%H:%M, %d/%m/%Y'),datetime(2026,10,18,10,32))
+        self.assertEqual(parse_time('[9:05 PM, 10/18/2026] Bob: ','%I:%M %p, %m/%d/%Y'),datetime(2026,10,18,21,5))
+        self.assertIsNone(parse_time('[10:32, 18/10/2026] Alice: ','%H:%M, %m/%d/%Y'))
+        self.assertIsNone(parse_time(None,'%H:%M, %d/%m/%Y'))
+        self.assertIsNone(parse_time('Alice','%H:%M, %d/%m/%Y'))
+        self.assertIsNone(parse_time('[10:32, 18/10/2026] Alice: ',None))
+
+    def test_detect_month_first(self):
+        time_format:str=detect_time_format(['[10:15, 05/10/2026] Alice: ','[10:15, 10/18/2026] Alice: ',None])
+        self.assertEqual(time_format,'%H:%M, %m/%d/%Y')
+        self.assertEqual(parse_time('[10:15, 05/10/2026] Alice: ',time_format),datetime(2026,5,10,10,15))
+
+    def test_detect_day_first(self):
+        self.assertEqual(detect_time_format(['[10:15, 18/10/2026] Alice: ','[10:15, 05/10/2026] Alice: ']),
+                         '%H:%M, %d/%m/%Y')
+
+    def test_detect_ambiguous(self):
+        self.assertIsNone(detect_time_format(['[10:15, 05/10/2026] Alice: ','[10:15, 07/10/2026] Alice: ']))
+
+    def test_guess(self):
+        self.assertEqual(guess_time('[10:15, 18/10/2026] Alice: '),datetime(2026,10,18,10,15))
+        self.assertEqual(guess_time('[10:15, 10/10/2026] Alice: '),datetime(2026,10,10,10,15))
+        self.assertIsNone(guess_time('[10:15, 05/10/2026] Alice: '))
+        self.assertIsNone(guess_time('Alice'))
+
+    def test_detect_nothing(self):
+        self.assertIsNone(detect_time_format([None,'Alice']))
+        self.assertIsNone(detect_time_format(['[yesterday] Alice: ']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+from unittest import TestCase,main
+from whatsapp._whatsapp import count_unread,UNREAD,NEW_MESSAGE
+
+def unread(who:str,count:int):
+    return {'type':UNREAD,'who':who,'count':count}
+
+def new_message(message_id:str):
+    return {'type':NEW_MESSAGE,'id':message_id}
+
+class UnreadCase(TestCase):
+    def test_badges(self):
+        self.assertEqual(count_unread([unread('X',1),unread('Y',2),unread('X',3)],None,{}),{'X':3,'Y':2})
+
+    def test_left_chat(self):
+        self.assertEqual(count_unread([unread('X',3)],None,{'X':2}),{'X':5})
+
+    def test_open_chat(self):
+        self.assertEqual(count_unread([new_message('a'),new_message('b'),unread('Y',1)],'X',{'X':1}),
+                         {'X':3,'Y':1})
+
+    def test_default_chat(self):
+        self.assertEqual(count_unread([new_message('a')],None,{}),{})
+
+    def test_empty(self):
+        self.assertEqual(count_unread([unread('X',0)],'X',{}),{})
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,7 @@
-from ._whatsapp import Whatsapp,Message,WhatsappOptions,MessageType
+from ._whatsapp import Whatsapp,Message,Media,WhatsappOptions,MessageType
+from ._pool import SessionPool
+from ._directory import ContactDirectory
+from ._staging import MediaStaging
+from ._metrics import METRICS,Metrics,Histogram
+from ._launch import LAUNCH_PROFILES,DEFAULT_PROFILE,LEAN_PROFILE,is_headless
+from ._profile import profile_size,compact_profile,snapshot_profile,restore_profile,remove_snapshot
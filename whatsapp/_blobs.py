@@ -0,0 +1,37 @@
+from typing import Dict,Optional,NoReturn
+from collections import OrderedDict
+from threading import Lock
+
+class BlobCache:
+    def __init__(self,capacity:int):
+        self.capacity:int=capacity
+        self.size:int=0
+        self._blobs:Dict[str,bytes]=OrderedDict()
+        self._lock:Lock=Lock()
+
+    def get(self,url:str)->Optional[bytes]:
+        with self._lock:
+            data:Optional[bytes]=self._blobs.get(url)
+            if data is not None:
+                self._blobs.move_to_end(url)
+            return data
+
+    def put(self,url:str,data:bytes)->NoReturn:
+        if len(data)>self.capacity:
+            return
+        with self._lock:
+            previous:Optional[bytes]=self._blobs.pop(url,None)
+            if previous is not None:
+                self.size-=len(previous)
+            self._blobs[url]=data
+            self.size+=len(data)
+            while self.size>self.capacity:
+                _,evicted=self._blobs.popitem(last=False)
+                self.size-=len(evicted)
+
+    def __contains__(self,url:str)->bool:
+        with self._lock:
+            return url in self._blobs
+
+    def __len__(self)->int:
+        return len(self._blobs)
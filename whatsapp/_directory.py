@@ -0,0 +1,46 @@
+from typing import Set,Dict,Optional,Iterable,NoReturn
+from threading import Lock
+from time import monotonic
+
+class ContactDirectory:
+    def __init__(self,ttl:float,ignore_case:bool=False):
+        self.ttl:float=ttl
+        self.ignore_case:bool=ignore_case
+        self._names:Set[str]=set()
+        self._missing:Dict[str,float]={}
+        self._updated:Optional[float]=None
+        self._lock:Lock=Lock()
+
+    @property
+    def stale(self)->bool:
+        return self._updated is None or monotonic()-self._updated>=self.ttl
+
+    def _key(self,name:str)->str:
+        return name.casefold() if self.ignore_case else name
+
+    def refresh(self,names:Iterable[str])->NoReturn:
+        with self._lock:
+            self._names={self._key(name) for name in names}
+            self._missing={}
+            self._updated=monotonic()
+
+    def add(self,name:str)->NoReturn:
+        with self._lock:
+            self._names.add(self._key(name))
+            self._missing.pop(self._key(name),None)
+
+    def add_missing(self,name:str)->NoReturn:
+        with self._lock:
+            self._missing[self._key(name)]=monotonic()
+
+    def missing(self,name:str)->bool:
+        with self._lock:
+            checked:Optional[float]=self._missing.get(self._key(name))
+            return checked is not None and monotonic()-checked<self.ttl
+
+    def __contains__(self,name:str)->bool:
+        with self._lock:
+            return self._key(name) in self._names
+
+    def __len__(self)->int:
+        return len(self._names)
@@ -0,0 +1,41 @@
+from selenium.webdriver import Chrome,ChromeOptions
+from selenium.webdriver.remote.webdriver import WebDriver
+from typing import Dict,List,NoReturn
+
+DEFAULT_PROFILE='default'
+LEAN_PROFILE='lean'
+LEAN_ARGUMENTS:List[str]=['--headless',
+                          '--window-size=1280,960',
+                          '--disable-gpu',
+                          '--disable-extensions',
+                          '--disable-default-apps',
+                          '--disable-sync',
+                          '--no-first-run',
+                          '--mute-audio',
+                          '--disable-background-networking',
+                          '--disable-background-timer-throttling',
+                          '--disable-renderer-backgrounding',
+                          '--disk-cache-size=1048576',
+                          '--media-cache-size=1048576',
+                          '--renderer-process-limit=1',
+                          '--js-flags=--max-old-space-size=512']
+LAUNCH_PROFILES:Dict[str,List[str]]={DEFAULT_PROFILE:[],LEAN_PROFILE:LEAN_ARGUMENTS}
+HEADLESS='HeadlessChrome'
+CDP_COMMAND='executeCdpCommand'
+
+def apply_profile(options:ChromeOptions,profile:str)->NoReturn:
+    if profile not in LAUNCH_PROFILES:
+        raise ValueError(f'Unknown launch profile {profile}, use one of {", ".join(LAUNCH_PROFILES.keys())}')
+    for argument in LAUNCH_PROFILES[profile]:
+        options.add_argument(argument)
+
+def is_headless(profile:str)->bool:
+    return '--headless' in LAUNCH_PROFILES.get(profile,[])
+
+def hide_headless(driver:WebDriver)->NoReturn:
+    user_agent:str=driver.execute_script('return navigator.userAgent;')
+    override:Dict[str,str]={'userAgent':user_agent.replace(HEADLESS,'Chrome')}
+    if isinstance(driver,Chrome):
+        driver.execute_cdp_cmd('Network.setUserAgentOverride',override)
+    else:
+        driver.execute(CDP_COMMAND,{'cmd':'Network.setUserAgentOverride','params':override})
@@ -0,0 +1,54 @@
+from typing import List,Dict,Optional,NoReturn
+from threading import Thread,Lock
+from concurrent.futures import ThreadPoolExecutor,Future
+from time import sleep
+
+class LoginWatcher:
+    def __init__(self,interval:float=0.5,workers:int=4):
+        self.interval:float=interval
+        self._sessions:List=[]
+        self._checks:Dict[object,Future]={}
+        self._lock:Lock=Lock()
+        self._thread:Optional[Thread]=None
+        self._executor:ThreadPoolExecutor=ThreadPoolExecutor(workers,thread_name_prefix='login-check')
+
+    def watch(self,session)->NoReturn:
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread=Thread(target=self._run,name='login-watcher',daemon=True)
+                self._thread.start()
+
+    def forget(self,session)->NoReturn:
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            self._checks.pop(session,None)
+
+    def _run(self)->NoReturn:
+        while True:
+            with self._lock:
+                if len(self._sessions)==0:
+                    self._thread=None
+                    return
+                for session in self._sessions:
+                    check:Optional[Future]=self._checks.get(session)
+                    if check is None or check.done():
+                        self._checks[session]=self._executor.submit(self._check,session)
+            sleep(self.interval)
+
+    def _check(self,session)->NoReturn:
+        try:
+            done:bool=session._check_login()
+        except Exception as e:
+            if session.running:
+                session.logger.error(f'Checking the login of {session.name} failed: {e}',exc_info=True)
+            session._login_done.set()
+            done=True
+        if done:
+            self.forget(session)
+
+    def __len__(self)->int:
+        return len(self._sessions)
+
+LOGIN_WATCHER:LoginWatcher=LoginWatcher()
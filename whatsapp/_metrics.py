@@ -0,0 +1,95 @@
+from typing import Dict,Tuple,List,NoReturn,Iterator,Callable,Any,Optional
+from threading import Lock
+from contextlib import contextmanager
+from functools import wraps
+from time import monotonic
+from bisect import bisect_left
+
+BUCKETS:Tuple[float,...]=(0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60)
+INF=float('inf')
+
+class Histogram:
+    def __init__(self):
+        self.counts:List[int]=[0]*(len(BUCKETS)+1)
+        self.count:int=0
+        self.sum:float=0
+
+    def observe(self,value:float)->NoReturn:
+        self.counts[bisect_left(BUCKETS,value)]+=1
+        self.count+=1
+        self.sum+=value
+
+    def merge(self,other:'Histogram')->NoReturn:
+        self.counts=[a+b for a,b in zip(self.counts,other.counts)]
+        self.count+=other.count
+        self.sum+=other.sum
+
+    def quantile(self,q:float)->float:
+        rank:float=q*self.count
+        seen:int=0
+        for i,count in enumerate(self.counts):
+            seen+=count
+            if seen>=rank and count>0:
+                return BUCKETS[i] if i<len(BUCKETS) else INF
+        return 0
+
+class Metrics:
+    def __init__(self):
+        self._histograms:Dict[Tuple[str,str],Histogram]={}
+        self._lock:Lock=Lock()
+
+    def observe(self,operation:str,user:str,seconds:float)->NoReturn:
+        with self._lock:
+            histogram:Optional[Histogram]=self._histograms.get((operation,user))
+            if histogram is None:
+                histogram=self._histograms[(operation,user)]=Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self,operation:str,user:str)->Iterator[None]:
+        started:float=monotonic()
+        try:
+            yield
+        finally:
+            self.observe(operation,user,monotonic()-started)
+
+    def snapshot(self)->Dict[Tuple[str,str],Histogram]:
+        with self._lock:
+            result:Dict[Tuple[str,str],Histogram]={}
+            for key,histogram in self._histograms.items():
+                result[key]=Histogram()
+                result[key].merge(histogram)
+            return result
+
+    def by_operation(self)->Dict[str,Histogram]:
+        result:Dict[str,Histogram]={}
+        for (operation,_),histogram in self.snapshot().items():
+            result.setdefault(operation,Histogram()).merge(histogram)
+        return result
+
+    def by_user(self,operation:str)->Dict[str,Histogram]:
+        return {user:histogram for (name,user),histogram in self.snapshot().items() if name==operation}
+
+    def prometheus(self)->str:
+        lines:List[str]=['# TYPE whatsappwebbot_operation_seconds histogram']
+        for (operation,user),histogram in sorted(self.snapshot().items()):
+            labels:str=f'operation="{operation}",user="{user}"'
+            cumulative:int=0
+            for bound,count in zip(BUCKETS+(INF,),histogram.counts):
+                cumulative+=count
+                le:str='+Inf' if bound==INF else repr(bound)
+                lines.append(f'whatsappwebbot_operation_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'whatsappwebbot_operation_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'whatsappwebbot_operation_seconds_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines)+'\n'
+
+METRICS:Metrics=Metrics()
+
+def timed(operation:str)->Callable[[Callable[...,Any]],Callable[...,Any]]:
+    def decorator(method:Callable[...,Any])->Callable[...,Any]:
+        @wraps(method)
+        def wrapper(self,*args,**kwargs):
+            with METRICS.time(operation,self.name):
+                return method(self,*args,**kwargs)
+        return wrapper
+    return decorator
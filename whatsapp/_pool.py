@@ -0,0 +1,68 @@
+from selenium.webdriver import Remote,ChromeOptions
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
+from selenium.webdriver.remote.webdriver import WebDriver
+from pyvirtualdisplay import Display
+from typing import Optional,NoReturn,Dict,List,Iterable
+from threading import Lock
+from os import listdir
+from os.path import join
+
+CHROMEDRIVER='chromedriver'
+PROC='/proc'
+BROWSER='browser'
+DRIVER='driver'
+DISPLAY='display'
+
+class SessionPool:
+    def __init__(self,interactive:bool,show:bool,executable:str=CHROMEDRIVER):
+        self.display:Optional[Display]=None
+        if not interactive:
+            self.display=Display(visible=show)
+            self.display.start()
+        self.service:Service=Service(executable)
+        self.service.start()
+        self._lock:Lock=Lock()
+        self.sessions:int=0
+
+    def create_driver(self,options:ChromeOptions)->WebDriver:
+        with self._lock:
+            self.sessions+=1
+        return Remote(ChromeRemoteConnection(self.service.service_url),options=options)
+
+    def release(self,driver:WebDriver)->NoReturn:
+        driver.quit()
+        with self._lock:
+            self.sessions-=1
+
+    def memory_usage(self)->Dict[str,int]:
+        return {DRIVER:resident_memory([self.service.process.pid]),
+                DISPLAY:resident_memory(display_pids(self.display))}
+
+    def close(self)->NoReturn:
+        self.service.stop()
+        if self.display is not None:
+            self.display.stop()
+
+def display_pids(display:Optional[Display])->List[int]:
+    pid:Optional[int]=getattr(display,'pid',None)
+    return [] if pid is None else [pid]
+
+def _read(pid:str,name:str)->str:
+    try:
+        with open(join(PROC,pid,name),'rb') as f:
+            return f.read().decode(errors='replace')
+    except OSError:
+        return ''
+
+def profile_pids(profile_dir:str)->List[int]:
+    argument:str=f'--user-data-dir={profile_dir}'
+    return [int(pid) for pid in listdir(PROC) if pid.isdigit() and argument in _read(pid,'cmdline').split('\0')]
+
+def resident_memory(pids:Iterable[int])->int:
+    result:int=0
+    for pid in pids:
+        for line in _read(str(pid),'status').splitlines():
+            if line.startswith('VmRSS:'):
+                result+=int(line.split()[1])*1024
+    return result
@@ -0,0 +1,73 @@
+from typing import List,NoReturn
+from os import walk,replace,remove,makedirs
+from os.path import join,getsize,islink,exists,dirname,basename,normpath,isabs
+from shutil import rmtree
+from tarfile import TarFile,TarInfo
+from tarfile import open as open_tar
+from tempfile import mkdtemp
+
+DISPOSABLE:List[str]=['Default/Cache',
+                      'Default/Code Cache',
+                      'Default/GPUCache',
+                      'Default/Media Cache',
+                      'Default/Service Worker/CacheStorage',
+                      'Default/Service Worker/ScriptCache',
+                      'Default/blob_storage',
+                      'GrShaderCache',
+                      'ShaderCache',
+                      'GraphiteDawnCache',
+                      'Crashpad',
+                      'BrowserMetrics']
+LOCKS:List[str]=['SingletonLock','SingletonSocket','SingletonCookie']
+
+def profile_size(profile_dir:str)->int:
+    total:int=0
+    for root,_directories,files in walk(profile_dir):
+        for file in files:
+            path:str=join(root,file)
+            if not islink(path):
+                total+=getsize(path)
+    return total
+
+def compact_profile(profile_dir:str)->int:
+    before:int=profile_size(profile_dir)
+    for path in DISPOSABLE:
+        rmtree(join(profile_dir,path),ignore_errors=True)
+    return before-profile_size(profile_dir)
+
+def _keep(info:TarInfo)->bool:
+    name:str=info.name.split('/',1)[1] if '/' in info.name else ''
+    return basename(name) not in LOCKS and not any(name==path or name.startswith(path+'/') for path in DISPOSABLE)
+
+def snapshot_profile(profile_dir:str,snapshot_file:str)->int:
+    makedirs(dirname(snapshot_file),exist_ok=True)
+    tmp:str=snapshot_file+'.tmp'
+    with open_tar(tmp,'w:gz') as tar:
+        tar.add(profile_dir,arcname='profile',filter=lambda info:info if _keep(info) else None)
+    replace(tmp,snapshot_file)
+    return getsize(snapshot_file)
+
+def restore_profile(snapshot_file:str,profile_dir:str)->NoReturn:
+    target:str=mkdtemp(prefix='.restore-',dir=dirname(normpath(profile_dir)))
+    try:
+        with open_tar(snapshot_file,'r:gz') as tar:
+            _check_members(tar)
+            tar.extractall(target)
+        if exists(profile_dir):
+            rmtree(profile_dir)
+        replace(join(target,'profile'),profile_dir)
+    finally:
+        rmtree(target,ignore_errors=True)
+
+def _check_members(tar:TarFile)->NoReturn:
+    for member in tar.getmembers():
+        name:str=normpath(member.name)
+        if isabs(name) or name.startswith('..') or not (name=='profile' or name.startswith('profile/')) or \
+                member.issym() or member.islnk():
+            raise ValueError(f'Unsafe path {member.name} in the snapshot')
+
+def remove_snapshot(snapshot_file:str)->NoReturn:
+    try:
+        remove(snapshot_file)
+    except FileNotFoundError:
+        pass
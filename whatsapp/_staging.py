@@ -0,0 +1,107 @@
+from typing import Dict,Optional,NoReturn,Callable,BinaryIO
+from hashlib import sha256
+from tempfile import mkdtemp,gettempdir
+from threading import Thread,Event,Lock
+from shutil import rmtree
+from os import replace,remove
+from os.path import join,isdir,exists
+from time import monotonic
+from logging import Logger,getLogger
+
+TMPFS='/dev/shm'
+
+class _HashingWriter:
+    def __init__(self,file:BinaryIO):
+        self.file:BinaryIO=file
+        self.hash=sha256()
+
+    def write(self,data:bytes)->int:
+        self.hash.update(data)
+        return self.file.write(data)
+
+class MediaStaging:
+    def __init__(self,directory:Optional[str]=None,ttl:float=600,cleanup_interval:float=60,
+                 logger:Optional[Logger]=None):
+        if directory is None:
+            directory=TMPFS if isdir(TMPFS) else gettempdir()
+        self.directory:str=mkdtemp(prefix='whatsappwebbot-',dir=directory)
+        self.ttl:float=ttl
+        self.logger:Logger=getLogger('MediaStaging') if logger is None else logger
+        self._references:Dict[str,int]={}
+        self._used:Dict[str,float]={}
+        self._lock:Lock=Lock()
+        self._stop:Event=Event()
+        self._cleanup_interval:float=cleanup_interval
+        self._thread:Thread=Thread(target=self._run,name='media-staging',daemon=True)
+        self._thread.start()
+
+    def stage(self,data:bytes,suffix:str='')->str:
+        path:str=self._path(sha256(data).hexdigest(),suffix)
+        with self._lock:
+            if not exists(path):
+                with open(path+'.tmp','wb') as f:
+                    f.write(data)
+                replace(path+'.tmp',path)
+            return self._acquire(path)
+
+    def stage_stream(self,download:Callable[[BinaryIO],NoReturn],suffix:str='')->str:
+        tmp:str=mkdtemp(dir=self.directory)
+        try:
+            with open(join(tmp,'download'),'wb') as f:
+                writer:_HashingWriter=_HashingWriter(f)
+                download(writer)
+            path:str=self._path(writer.hash.hexdigest(),suffix)
+            with self._lock:
+                if not exists(path):
+                    replace(join(tmp,'download'),path)
+                return self._acquire(path)
+        finally:
+            rmtree(tmp,ignore_errors=True)
+
+    def release(self,path:str)->NoReturn:
+        with self._lock:
+            references:int=self._references.get(path,0)-1
+            if references<=0:
+                self._references.pop(path,None)
+            else:
+                self._references[path]=references
+            self._used[path]=monotonic()
+
+    def cleanup(self)->int:
+        removed:int=0
+        now:float=monotonic()
+        with self._lock:
+            for path,used in list(self._used.items()):
+                if path not in self._references and now-used>=self.ttl:
+                    del self._used[path]
+                    try:
+                        remove(path)
+                        removed+=1
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def close(self)->NoReturn:
+        self._stop.set()
+        self._thread.join()
+        rmtree(self.directory,ignore_errors=True)
+
+    def _path(self,digest:str,suffix:str)->str:
+        return join(self.directory,digest+suffix)
+
+    def _acquire(self,path:str)->str:
+        self._references[path]=self._references.get(path,0)+1
+        self._used[path]=monotonic()
+        return path
+
+    def _run(self)->NoReturn:
+        while not self._stop.wait(self._cleanup_interval):
+            try:
+                removed:int=self.cleanup()
+                if removed>0:
+                    self.logger.debug(f'Removed {removed} staged file/s')
+            except Exception as e:
+                self.logger.error(f'Cleaning the staged media failed: {e}',exc_info=True)
+
+    def __len__(self)->int:
+        return len(self._used)
@@ -1,54 +1,253 @@
 from selenium.webdriver import Chrome,ChromeOptions
 from selenium.webdriver.chrome.webdriver import WebDriver
 from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support.expected_conditions import element_to_be_clickable
+from selenium.webdriver.common.by import By
 from selenium.webdriver.remote.webelement import WebElement
-from selenium.common.exceptions import TimeoutException,NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.keys import Keys
-from threading import Thread
-from typing import Optional,NoReturn,Callable,List,Tuple,Union
+from threading import Event
+from hashlib import sha256
+from typing import Optional,NoReturn,Callable,List,Tuple,Union,Dict,Any,Iterator,Set
 from atexit import register,unregister
-from time import sleep
+from time import monotonic
 from pyvirtualdisplay import Display
 from logging import getLogger,INFO,DEBUG,Logger
 from os.path import basename
 from base64 import b64decode
 from enum import Enum
-from os.path import join,abspath
-
+from datetime import datetime
+from os.path import abspath
+from ._directory import ContactDirectory
+from ._blobs import BlobCache
+from ._staging import MediaStaging
+from ._login import LOGIN_WATCHER
+from ._launch import apply_profile,is_headless,hide_headless,DEFAULT_PROFILE
+from ._metrics import timed
+from ._pool import SessionPool,profile_pids,resident_memory,display_pids,BROWSER,DRIVER,DISPLAY
+
+WHATSAPP_URL='https://web.whatsapp.com'
 QR_CODE="//canvas[@aria-label='Scan me!']"
 HOME_PAGE_IMAGE='//div[@data-asset-intro-image-light="true"][@style="transform: scale(1); opacity: 1;"]'
 HOME_PAGE_IMAGE2='//div[@data-asset-intro-image-light="true"][@style="opacity: 1;"]'
 SEARCH_BAR='//div[@contenteditable="true"][@data-tab="3"]'
 CONTACT_BOX='//span[contains(@title,"{}")]'
 INPUT_BOX='//div[@contenteditable="true"][@spellcheck="true"]'
+CAPTION_BOX='//div[@data-testid="media-caption-input-container"]//div[@contenteditable="true"]'
+CHAT_TITLES='//div[@id="pane-side"]//div[@data-testid="cell-frame-title"]//span[@title]'
+CHAT_HEADER='//header//span[contains(@title,"{}")]'
 UNREAD_MESSAGES='//span[contains(@aria-label,"unread message")]'
 MESSAGES='//div[contains(@class,"message-in focusable-list-item")][@tabindex="-1"]'
 TEXT_IN_MESSAGE='.//span[contains(@class,"selectable-text invisible-space copyable-text")]'
 AUDIO_IN_MESSAGE='.//audio'
 IMAGE_IN_MESSAGE='.//img[contains(@src,"blob:")]'
 WHO_FROM_UNREAD='./../../../../../div[1]/div[1]'
+TIME_IN_MESSAGE='.//div[@data-pre-plain-text]'
 SENDER_IN_MESSAGE='.{}/span'
 DIV='/div[1]'
+FIND_NODES=(
+    'var find=function(xpath,node){var r=document.evaluate(xpath,node,null,'
+    'XPathResult.ORDERED_NODE_SNAPSHOT_TYPE,null),a=[];'
+    'for(var i=0;i<r.snapshotLength;i++){a.push(r.snapshotItem(i));}return a;};'
+    'var first=function(xpath,node){var r=find(xpath,node);return r.length>0?r[0]:null;};'
+    'var messageId=function(node){var parent=node.closest("[data-id]");'
+    'return parent===null?null:parent.getAttribute("data-id");};')
 IMAGE_CAPTION='./div[1]/div[1]/div[1]/div[1]/div/div[1]/span/span'
 ADD_FILE='//span[@data-testid="{0}"][@data-icon="{0}"]'
 CLIP='clip'
 ATTACH_IMAGE='attach-image'
 SEND='send'
+MEDIA_THUMB='//div[@data-testid="media-thumb"]'
+OBSERVER='wwbObserver'
+UNREAD='unread'
+NEW_MESSAGE='message'
+BLOBS='wwbBlobs'
+QR_STATE='qr'
+HOME_STATE='home'
+TIME_FORMATS=['%H:%M, %d/%m/%Y','%I:%M %p, %m/%d/%Y','%H:%M, %m/%d/%Y','%H:%M, %Y-%m-%d']
+OBSERVER_DEBOUNCE=100
+INSTALL_OBSERVER=(
+    'var unreadXpath=arguments[0],whoXpath=arguments[1],messagesXpath=arguments[2],debounce=arguments[3];'
+    f'if(window.{OBSERVER}!==undefined){{return false;}}'
+    'var state={events:[],unread:{},seen:new Set(),scheduled:false};'
+    +FIND_NODES+
+    'var scan=function(notify){'
+    'state.scheduled=false;var unread={};'
+    'find(unreadXpath,document).forEach(function(bubble){var who=find(whoXpath,bubble)[0];'
+    'if(who!==undefined){unread[who.textContent]=parseInt(bubble.textContent)||0;}});'
+    'Object.keys(unread).forEach(function(who){if(state.unread[who]!==unread[who]){'
+    f'state.events.push({{type:"{UNREAD}",who:who,count:unread[who]}});}}}});'
+    'state.unread=unread;'
+    'find(messagesXpath,document).forEach(function(node){var id=messageId(node);'
+    'if(id!==null&&!state.seen.has(id)){state.seen.add(id);'
+    f'if(notify){{state.events.push({{type:"{NEW_MESSAGE}",id:id}});}}}}}});}};'
+    'scan(false);'
+    f'state.events=Object.keys(state.unread).map(function(who){{'
+    f'return {{type:"{UNREAD}",who:who,count:state.unread[who]}};}});'
+    'new MutationObserver(function(){if(!state.scheduled){state.scheduled=true;'
+    'setTimeout(function(){scan(true);},debounce);}})'
+    '.observe(document.body,{childList:true,subtree:true,characterData:true});'
+    f'state.scan=scan;window.{OBSERVER}=state;return true;')
+DRAIN_EVENTS=(
+    f'var state=window.{OBSERVER};'
+    'if(state===undefined){return null;}'
+    'var events=state.events;state.events=[];return events;')
+EXTRACT_MESSAGES=(
+    'var messagesXpath=arguments[0],imageXpath=arguments[1],captionXpath=arguments[2],textXpath=arguments[3],'
+    'audioXpath=arguments[4],senderXpaths=arguments[5],howMany=arguments[6],timeXpath=arguments[7],'
+    'before=arguments[8];'
+    +FIND_NODES+
+    'var nodes=find(messagesXpath,document);'
+    'if(before!==null){var end=nodes.findIndex(function(node){return messageId(node)===before;});'
+    'if(end<0){return null;}nodes=nodes.slice(0,end);}'
+    'return nodes.slice(Math.max(0,nodes.length-howMany)).reverse().map(function(node){'
+    'var item={type:null,text:null,caption:null,sender:null,url:null,id:messageId(node),time:null};'
+    'var time=first(timeXpath,node);if(time!==null){item.time=time.getAttribute("data-pre-plain-text");}'
+    'var image=first(imageXpath,node),text,audio;'
+    'if(image!==null){item.type="IMAGE";item.url=image.getAttribute("src");'
+    'var caption=first(captionXpath,node);item.caption=caption===null?"":caption.innerText;}'
+    'else if((text=first(textXpath,node))!==null){item.type="TEXT";item.text=text.innerText;}'
+    'else if((audio=first(audioXpath,node))!==null){item.type="AUDIO";item.url=audio.getAttribute("src");}'
+    'if(item.type!==null){var sender=first(senderXpaths[item.type],node);'
+    'item.sender=sender===null?null:sender.innerText;}'
+    'return item;});')
+MARK_SEEN=(
+    'var markSeen=function(state,nodes){var ids=new Set();'
+    'nodes.forEach(function(node){var id=messageId(node);if(id!==null){state.seen.add(id);ids.add(id);}});'
+    f'state.events=state.events.filter(function(event){{return event.type!=="{NEW_MESSAGE}"||!ids.has(event.id);}});}};')
+DROP_UNREAD=(
+    'var dropUnread=function(state,who){var count=0;'
+    f'state.events=state.events.filter(function(event){{if(event.type==="{UNREAD}"&&event.who===who){{'
+    'count=Math.max(count,event.count);return false;}return true;});return count;};')
+SYNC_OBSERVER=(
+    f'var state=window.{OBSERVER};'
+    'if(state===undefined){return 0;}'
+    +FIND_NODES+MARK_SEEN+DROP_UNREAD+
+    'markSeen(state,find(arguments[0],document));return dropUnread(state,arguments[1]);')
+TAKE_NEW_MESSAGES=(
+    f'var state=window.{OBSERVER},who=arguments[0];'
+    'if(state===undefined){return {count:0,unread:0};}'
+    +DROP_UNREAD+
+    'state.scan(true);var count=0;'
+    f'state.events=state.events.filter(function(event){{if(event.type==="{NEW_MESSAGE}"){{count++;return false;}}'
+    'return true;});'
+    'return {count:count,unread:Math.max(dropUnread(state,who),state.unread[who]||0)};')
+SCROLL_BACK=(
+    'var xpath=arguments[0],timeout=arguments[1],callback=arguments[arguments.length-1];'
+    +FIND_NODES+MARK_SEEN+
+    'var nodes=find(xpath,document);'
+    'if(nodes.length===0){callback(false);return;}'
+    'var pane=nodes[0].parentElement;'
+    'while(pane!==null&&!(pane.scrollHeight>pane.clientHeight&&'
+    '/(auto|scroll)/.test(getComputedStyle(pane).overflowY))){pane=pane.parentElement;}'
+    'if(pane===null){callback(false);return;}'
+    'var count=nodes.length,oldest=messageId(nodes[0]),started=Date.now();'
+    'pane.scrollTop=0;'
+    'var check=function(){var loaded=find(xpath,document);'
+    'if(loaded.length>count){'
+    'var end=loaded.findIndex(function(node){return messageId(node)===oldest;});'
+    f'if(window.{OBSERVER}!==undefined){{markSeen(window.{OBSERVER},'
+    'loaded.slice(0,end<0?loaded.length-count:end));}'
+    'callback(true);}'
+    'else if(Date.now()-started>timeout){callback(false);}else{setTimeout(check,100);}};'
+    'setTimeout(check,100);')
+LOGIN_STATE=(
+    FIND_NODES+
+    'var qr=first(arguments[0],document);'
+    f'if(qr!==null){{return {{state:"{QR_STATE}",data:qr.toDataURL("image/png")}};}}'
+    'if(first(arguments[1],document)!==null||first(arguments[2],document)!==null)'
+    f'{{return {{state:"{HOME_STATE}"}};}}'
+    'return {state:"loading"};')
+READ_CHAT_TITLES=(
+    FIND_NODES+
+    'return find(arguments[0],document).map(function(node){return node.getAttribute("title");});')
+FETCH_BLOBS=(
+    f'var urls=arguments[0],callback=arguments[arguments.length-1],store=window.{BLOBS}=window.{BLOBS}||{{}};'
+    'Promise.all(urls.map(function(url){'
+    'return fetch(url).then(function(response){if(!response.ok){throw response.status;}return response.blob();})'
+    '.then(function(blob){store[url]=blob;return {size:blob.size};},'
+    'function(error){return {error:String(error)};});})).then(callback);')
+READ_BLOB_CHUNK=(
+    f'var blob=(window.{BLOBS}||{{}})[arguments[0]],callback=arguments[arguments.length-1];'
+    'if(blob===undefined){callback(null);return;}'
+    'var reader=new FileReader();'
+    'reader.onload=function(){var url=reader.result;callback(url.substring(url.indexOf(",")+1));};'
+    'reader.onerror=function(){callback(null);};'
+    'reader.readAsDataURL(blob.slice(arguments[1],arguments[2]));')
+RELEASE_BLOBS=(
+    f'var store=window.{BLOBS}||{{}};'
+    'arguments[0].forEach(function(url){delete store[url];});')
 
 class WhatsappOptions:
     def __init__(self):
         self.interactive:bool=False
         self.show:bool=False
         self.debug:bool=False
+        self.poll_interval:float=0.5
+        self.poll_workers:int=4
+        self.max_poll_interval:float=0.75
+        self.poll_deadline:float=30
+        self.idle_chat_timeout:float=30
+        self.login_timeout:float=20
+        self.search_timeout:float=2
+        self.chat_timeout:float=5
+        self.send_timeout:float=10
+        self.wait_poll_frequency:float=0.1
+        self.telegram_workers:int=4
+        self.telegram_rate:float=30
+        self.telegram_chat_rate:float=1
+        self.telegram_group_rate:float=20/60
+        self.coalesce_limit:int=0
+        self.shared_session_pool:bool=False
+        self.idle_timeout:Optional[float]=None
+        self.wake_interval:Optional[float]=900
+        self.lifecycle_workers:int=2
+        self.restore_workers:int=4
+        self.directory_ttl:float=300
+        self.directory_ignore_case:bool=False
+        self.compact_every:int=100
+        self.compact_interval:float=3600
+        self.log_capacity:int=1000
+        self.metrics_port:Optional[int]=None
+        self.url:str=WHATSAPP_URL
+        self.telegram_api_url:Optional[str]=None
+        self.blob_chunk_size:int=1024*1024
+        self.blob_cache_size:int=32*1024*1024
+        self.staging_dir:Optional[str]=None
+        self.staging_ttl:float=600
+        self.photo_max_side:Optional[int]=1600
+        self.album_window:float=1.5
+        self.launch_profile:str=DEFAULT_PROFILE
+        self.compact_on_hibernate:bool=False
+        self.qr_edit:bool=True
+        self.history_batch:int=50
+        self.history_scroll_timeout:float=5
+        self.time_format:Optional[str]=None
 
 class Whatsapp:
-    def __init__(self,profile_dir:str,default_chat:Optional[str],options:WhatsappOptions=WhatsappOptions())->NoReturn:
+    def __init__(self,profile_dir:str,default_chat:Optional[str],options:WhatsappOptions=WhatsappOptions(),
+                 pool:Optional[SessionPool]=None,staging:Optional[MediaStaging]=None)->NoReturn:
         self.display:Optional[Display]=None
-        if not options.interactive:
+        self.pool:Optional[SessionPool]=pool
+        self._owns_staging:bool=staging is None
+        self.staging:MediaStaging=MediaStaging(options.staging_dir,options.staging_ttl) if staging is None\
+            else staging
+        if pool is None and not options.interactive and not is_headless(options.launch_profile):
             self.display=Display(visible=options.show)
             self.display.start()
         self._logged_in:bool=False
+        self.login_time:Optional[float]=None
         self._default_chat:Optional[str]=default_chat
+        self._current_chat:Optional[str]=None
+        self._new_messages:Dict[str,int]={}
+        self._badges:Dict[str,int]={}
+        self._time_format:Optional[str]=options.time_format
+        self._last_activity:float=monotonic()
+        self._started:float=monotonic()
+        self.directory:ContactDirectory=ContactDirectory(options.directory_ttl,
+                                                            options.directory_ignore_case)
+        self._blobs:BlobCache=BlobCache(options.blob_cache_size)
+        self.options:WhatsappOptions=options
         self.name: str = basename(profile_dir)
         self.logger:Logger=getLogger(self.name)
         self.logger.setLevel(DEBUG if options.debug else INFO)
@@ -57,14 +256,20 @@ class Whatsapp:
         self._qr_callback:Optional[Callable[[bytes],NoReturn]]=None
         self.logged_in_callback: Optional[Callable[[], NoReturn]] = None
         self._qr_code_png:Optional[bytes]=None
-        options:ChromeOptions=ChromeOptions()
-        options.add_argument(f'--user-data-dir={profile_dir}')
-        self.driver:WebDriver = Chrome(options=options)
-        self.driver.get("https://web.whatsapp.com")
+        self._qr_hash:Optional[str]=None
+        self._login_done:Event=Event()
+        self._login_deadline:float=monotonic()+2*options.login_timeout
+        chrome_options:ChromeOptions=ChromeOptions()
+        chrome_options.add_argument(f'--user-data-dir={profile_dir}')
+        apply_profile(chrome_options,options.launch_profile)
+        self.driver:WebDriver = Chrome(options=chrome_options) if pool is None else pool.create_driver(chrome_options)
+        if is_headless(options.launch_profile):
+            hide_headless(self.driver)
+        self.logger.debug(f'Session {self.name} launched with the {options.launch_profile} profile in '
+                          f'{monotonic()-self._started:.1f}s')
+        self.driver.get(options.url)
         register(self.close)
-        self._thread_name:str=f'{self.name}-qr-thread'
-        self._qr_thread:Thread=Thread(target=self._qr_code_thread,name=self._thread_name)
-        self._qr_thread.start()
+        LOGIN_WATCHER.watch(self)
 
     @property
     def default_chat(self)->str:
@@ -87,71 +292,118 @@ class Whatsapp:
     def close(self)->NoReturn:
         unregister(self.close)
         self.running=False
-        self.driver.quit()
+        LOGIN_WATCHER.forget(self)
+        if self.pool is None:
+            self.driver.quit()
+        else:
+            self.pool.release(self.driver)
         if self.display is not None:
             self.display.stop()
-        self._qr_thread.join()
-
-    def wait_for_login(self):
-        self._qr_thread.join()
-
-    def _qr_code_thread(self)->NoReturn:
-        try:
-            try:
-                canvas:WebElement = WebDriverWait(self.driver, 20).until(self._get_element_in_thread(QR_CODE))
-                while True:
-                    self._qr_code_png=canvas.screenshot_as_png
-                    if self._qr_callback is not None:
-                        self._qr_callback(self._qr_code_png)
-                    try:
-                        WebDriverWait(self.driver, 20).until_not(self._get_element_in_thread(QR_CODE))
-                        break
-                    except TimeoutException:
-                        continue
-            except TimeoutException:
-                self.logger.debug(f'The user {self.name} is already logged in')
+        if self._owns_staging:
+            self.staging.close()
+        self._login_done.set()
+
+    def memory_usage(self)->Dict[str,int]:
+        result:Dict[str,int]={BROWSER:resident_memory(profile_pids(self.profile_dir))}
+        if self.pool is None:
+            result[DRIVER]=resident_memory([self.driver.service.process.pid])
+            result[DISPLAY]=resident_memory(display_pids(self.display))
+        return result
 
-            WebDriverWait(self.driver, 20).until(self._get_element_in_thread(HOME_PAGE_IMAGE,HOME_PAGE_IMAGE2))
-            self.logger.debug(f'Main page for {self.name} loaded')
+    def wait_for_login(self,timeout:Optional[float]=None)->bool:
+        return self._login_done.wait(timeout)
+
+    def _check_login(self)->bool:
+        if not self.running:
+            self._login_done.set()
+            return True
+        state:Dict[str,str]=self.driver.execute_script(LOGIN_STATE,QR_CODE,HOME_PAGE_IMAGE,HOME_PAGE_IMAGE2)
+        if state['state']==QR_STATE:
+            self._login_deadline=monotonic()+2*self.options.login_timeout
+            self._show_qr(state['data'])
+            return False
+        if state['state']==HOME_STATE:
+            self.logger.debug(f'Main page for {self.name} loaded after {monotonic()-self._started:.1f}s')
+            self._install_observer()
+            self.login_time=monotonic()-self._started
             self._logged_in = True
             if self.logged_in_callback is not None:
                 self.logged_in_callback()
-        except ThreadStopError:
-            self.logger.debug(f'The thread {self._thread_name} was stopped by interrupt')
-        self.logger.debug(f'The thread {self._thread_name} is stopping normally')
-
-    def _get_element_in_thread(self,*x_paths:str)->Callable[[WebDriver],WebElement]:
-        def method(driver:WebDriver)->WebElement:
-            if not self.running:
-                raise ThreadStopError()
-            err:Exception=ValueError('No xpath provided')
-            for xpath in x_paths:
-                try:
-                    return driver.find_element_by_xpath(xpath)
-                except NoSuchElementException as e:
-                    err=e
-            raise err
-        return method
+            self._login_done.set()
+            return True
+        if monotonic()>self._login_deadline:
+            self.logger.warning(f'Whatsapp web of {self.name} did not load after {monotonic()-self._started:.1f}s')
+            self._login_done.set()
+            return True
+        return False
+
+    def _show_qr(self,data_url:str)->NoReturn:
+        digest:str=sha256(data_url.encode()).hexdigest()
+        if digest==self._qr_hash:
+            return
+        self._qr_hash=digest
+        self._qr_code_png=b64decode(data_url[data_url.index(',')+1:])
+        self.logger.debug(f'New QR code for {self.name}')
+        if self._qr_callback is not None:
+            self._qr_callback(self._qr_code_png)
+
+    def _wait(self,timeout:float)->WebDriverWait:
+        return WebDriverWait(self.driver,timeout,poll_frequency=self.options.wait_poll_frequency)
+
+    def _focus_input(self,xpath:str=INPUT_BOX)->WebElement:
+        input_box:WebElement=self._wait(self.options.chat_timeout)\
+            .until(lambda driver:driver.find_element_by_xpath(xpath))
+        input_box.click()
+        self._wait(self.options.chat_timeout).until(lambda driver:driver.switch_to.active_element==input_box)
+        return input_box
+
+    current_chat:Optional[str]=property(lambda self:self._current_chat)
 
     def _select_chat(self,who:Optional[str]):
-        if who is None:
+        self._last_activity=monotonic()
+        if who is None or who==self._current_chat:
             return
+        self._open_chat(who)
+
+    @timed('select_chat')
+    def _open_chat(self,who:str)->NoReturn:
         try:
             selected_contact:WebElement=self._search_user(who)
         except TimeoutException:
             raise UserNotFoundError(who)
+        self._enter_chat(who,selected_contact)
+
+    def _enter_chat(self,who:str,selected_contact:WebElement)->NoReturn:
+        unread:int=self._take_new_messages(who)
         selected_contact.click()
         self._clear_search_bar(who)
-        sleep(2)
+        self._wait(self.options.chat_timeout).until(lambda driver:driver.find_element_by_xpath(CHAT_HEADER.format(who)))
+        self._current_chat=who
+        self.directory.add(who)
+        unread=max(unread,self.driver.execute_script(SYNC_OBSERVER,MESSAGES,who))
+        unread-=self._badges.pop(who,0)
+        if unread>0:
+            self._new_messages[who]=self._new_messages.get(who,0)+unread
+
+    def _take_new_messages(self,who:str)->int:
+        taken:Dict[str,int]=self.driver.execute_script(TAKE_NEW_MESSAGES,who)
+        if taken['count']>0 and self._current_chat not in (None,self._default_chat):
+            self._new_messages[self._current_chat]=self._new_messages.get(self._current_chat,0)+taken['count']
+        return taken['unread']
+
+    def return_to_default_chat(self,idle_for:float=0)->bool:
+        if self._current_chat==self._default_chat or monotonic()-self._last_activity<idle_for:
+            return False
+        self.logger.debug(f'Session {self.name} is idle, returning to the default chat')
+        self._select_chat(self._default_chat)
+        return True
 
     def _search_user(self,who:str)->WebElement:
         search_bar: WebElement = self.driver.find_element_by_xpath(SEARCH_BAR)
         search_bar.click()
         search_bar.send_keys(who)
-        element=WebDriverWait(self.driver, 2).until(
-            lambda driver: self.driver.find_element_by_xpath(CONTACT_BOX.format(who)))
-        sleep(1)
-        return element
+        return self._wait(self.options.search_timeout).until(
+            element_to_be_clickable((By.XPATH,CONTACT_BOX.format(who))))
 
     def _clear_search_bar(self,who:str)->NoReturn:
         search_bar: WebElement = self.driver.find_element_by_xpath(SEARCH_BAR)
@@ -159,141 +411,409 @@ class Whatsapp:
         search_bar.send_keys(Keys.RIGHT*len(who))
         search_bar.send_keys(Keys.BACKSPACE*len(who))
 
+    def refresh_directory(self)->NoReturn:
+        self.directory.refresh(self.driver.execute_script(READ_CHAT_TITLES,CHAT_TITLES))
+        self.logger.debug(f'Contact directory of {self.name} refreshed with {len(self.directory)} chats')
+
+    @timed('user_exists')
     def user_exists(self,who:str)->bool:
+        if self.directory.stale:
+            self.refresh_directory()
+        if who in self.directory:
+            return True
+        if self.directory.missing(who):
+            return False
         result:bool
         try:
             self._search_user(who)
             result=True
+            self.directory.add(who)
         except TimeoutException:
             result=False
+            self.directory.add_missing(who)
         self._clear_search_bar(who)
         return result
 
     def _is_group(self)->bool:
         pass
 
+    @timed('get_messages')
     def get_messages(self,who:str,how_many:int)->List['Message']:
         self._select_chat(who)
-        messages: List[WebElement] = self.driver.find_elements_by_xpath(MESSAGES)
-        result: List[Message] = []
-        for i in range(len(messages) - 1, len(messages) - how_many - 1, -1):
-            data=self._get_message(messages[i])
-            if data is None:
+        self._badges.pop(who,None)
+        how_many+=self._new_messages.pop(who,0)
+        items:List[Dict[str,Any]]=self._extract_messages(how_many)
+        self._detect_time_format(items)
+        return [self._create_message(who,item) for item in items if item['type'] is not None]
+
+    def iter_messages(self,who:str,since:Optional[Union[str,datetime]]=None,
+                      limit:Optional[int]=None)->Iterator['Message']:
+        before:Optional[str]=None
+        count:int=0
+        while limit is None or count<limit:
+            self._select_chat(who)
+            items:Optional[List[Dict[str,Any]]]=self._extract_messages(self.options.history_batch,before)
+            if items is None or len(items)==0:
+                if not self.driver.execute_async_script(SCROLL_BACK,MESSAGES,self.options.history_scroll_timeout*1000):
+                    if items is None:
+                        self.logger.warning(f'Message {before} is no longer in the chat {who}')
+                    return
                 continue
-            message,message_type,divs=data
-            sender:Optional[str]
-            try:
-                sender = messages[i].find_element_by_xpath(SENDER_IN_MESSAGE.format(DIV * divs)).text
-            except NoSuchElementException:
-                self.logger.debug('Not in a group')
-                sender=None
-            result.append(Message(who, message, sender, message_type))
+            self._detect_time_format(items)
+            for item in items:
+                message:Message=self._create_message(who,item)
+                if item['id'] is not None and item['id']==since or \
+                        isinstance(since,datetime) and message.time is not None and message.time<since:
+                    return
+                before=item['id']
+                if item['type'] is None:
+                    continue
+                yield message
+                count+=1
+                if limit is not None and count>=limit:
+                    return
+            if before is None:
+                return
+
+    def _detect_time_format(self,items:List[Dict[str,Any]])->NoReturn:
+        if self._time_format is not None:
+            return
+        self._time_format=detect_time_format([item.get('time') for item in items])
+        if self._time_format is not None:
+            self.logger.debug(f'Message times of {self.name} use the format {self._time_format}')
+
+    def _create_message(self,who:str,item:Dict[str,Any])->'Message':
+        message_type:MessageType=MessageType.TEXT if item['type'] is None else MessageType[item['type']]
+        time:Optional[datetime]=guess_time(item.get('time')) if self._time_format is None else \
+            parse_time(item.get('time'),self._time_format)
+        if message_type==MessageType.TEXT:
+            return Message(who, item['text'], item['sender'], message_type, item['id'], time=time)
+        return Message(who, item.get('caption'), item['sender'], message_type, item['id'],
+                       Media(self, item['url'], message_type), time)
+
+    def _extract_messages(self,how_many:int,before:Optional[str]=None)->Optional[List[Dict[str,Any]]]:
+        return self.driver.execute_script(EXTRACT_MESSAGES,MESSAGES,IMAGE_IN_MESSAGE,IMAGE_CAPTION,TEXT_IN_MESSAGE,
+                                          AUDIO_IN_MESSAGE,{message_type.name:SENDER_IN_MESSAGE.format(DIV*divs)
+                                                            for message_type,divs in SENDER_DIVS.items()},how_many,
+                                          TIME_IN_MESSAGE,before)
+
+    def _install_observer(self)->bool:
+        installed:bool=self.driver.execute_script(INSTALL_OBSERVER,UNREAD_MESSAGES,WHO_FROM_UNREAD,MESSAGES,
+                                                  OBSERVER_DEBOUNCE)
+        if installed:
+            self.logger.debug(f'Message observer installed for {self.name}')
+        return installed
+
+    def get_events(self)->Optional[List[Dict[str,Any]]]:
+        return self.driver.execute_script(DRAIN_EVENTS)
+
+    def _scan_unread_chats(self)->Dict[str,int]:
+        result:Dict[str,int]={}
+        for bubble in self.driver.find_elements_by_xpath(UNREAD_MESSAGES):
+            result[bubble.find_element_by_xpath(WHO_FROM_UNREAD).text]=int(bubble.text)
         return result
 
-    def _get_message(self,div:WebElement)->Optional[Tuple[Union[str,bytes,Tuple[str,bytes]],'MessageType',int]]:
-        try:
-            image: WebElement = div.find_element_by_xpath(IMAGE_IN_MESSAGE)
-            caption:str
-            try:
-                caption=div.find_element_by_xpath(IMAGE_CAPTION).text
-            except NoSuchElementException:
-                caption=''
-            return (caption,self._download_blob(image.get_attribute('src'))), MessageType.IMAGE, 6
-        except NoSuchElementException:
-            pass
-        try:
-            text = div.find_element_by_xpath(TEXT_IN_MESSAGE)
-            return text.text,MessageType.TEXT,4
-        except NoSuchElementException:
-            pass
-        try:
-            audio: WebElement = div.find_element_by_xpath(AUDIO_IN_MESSAGE)
-            return self._download_blob(audio.get_attribute('src')),MessageType.AUDIO,5
-        except NoSuchElementException:
-            pass
-        return None
+    def _unread_chats(self)->Dict[str,int]:
+        events:Optional[List[Dict[str,Any]]]=self.get_events()
+        if events is None:
+            self.logger.debug(f'Message observer for {self.name} is missing, scanning the chat list')
+            self._current_chat=None
+            self._install_observer()
+            self.get_events()
+            self._badges=self._scan_unread_chats()
+            return dict(self._badges)
+        self._badges={}
+        for event in events:
+            if event['type']==UNREAD:
+                self.directory.add(event['who'])
+                self._badges[event['who']]=event['count']
+        current_chat:Optional[str]=None if self._current_chat==self._default_chat else self._current_chat
+        result:Dict[str,int]=count_unread(events,current_chat,self._new_messages)
+        self._new_messages={}
+        return result
 
+    @timed('get_unread_messages')
     def get_unread_messages(self)->List['Message']:
         result:List[Message]=[]
-        reset:bool=False
-        for bubble in self.driver.find_elements_by_xpath(UNREAD_MESSAGES):
-            how_many:int=int(bubble.text)
-            who:str=bubble.find_element_by_xpath(WHO_FROM_UNREAD).text
+        for who,how_many in self._unread_chats().items():
             result.extend(self.get_messages(who,how_many))
-            reset=True
-        if reset:
-            self._select_chat(self._default_chat)
         return result
 
+    @timed('send_message')
     def send_message(self,who:str,message:str)->NoReturn:
         self._select_chat(who)
 
-        input_box = self.driver.find_element_by_xpath(INPUT_BOX)
+        input_box:WebElement=self._focus_input()
         input_box.send_keys(message + Keys.ENTER)
-
-        self._select_chat(self.default_chat)
-
-    def send_photo(self,who:str,photo:bytes,caption:str)->NoReturn:
+        self._wait(self.options.send_timeout).until(lambda driver:input_box.text=='')
+
+    @timed('send_many')
+    def send_many(self,recipients:List[str],message:str,
+                  progress:Optional[Callable[[str,Optional[Exception]],NoReturn]]=None)->Dict[str,Optional[Exception]]:
+        results:Dict[str,Optional[Exception]]={}
+        pending:Optional[Tuple[str,WebElement]]=None
+
+        def report(who:str,error:Optional[Exception])->NoReturn:
+            results[who]=error
+            if error is not None:
+                self.logger.warning(f'Sending to {who} failed: {error}')
+            if progress is not None:
+                progress(who,error)
+
+        def confirm()->NoReturn:
+            nonlocal pending
+            if pending is None:
+                return
+            who,input_box=pending
+            pending=None
+            try:
+                self._wait(self.options.send_timeout).until(lambda driver:input_box.text=='')
+            except Exception as e:
+                report(who,e)
+            else:
+                report(who,None)
+
+        for who in self._broadcast_order(recipients):
+            self._last_activity=monotonic()
+            try:
+                if self.directory.missing(who):
+                    raise UserNotFoundError(who)
+                if who!=self._current_chat:
+                    try:
+                        selected_contact:WebElement=self._search_user(who)
+                    except TimeoutException:
+                        self.directory.add_missing(who)
+                        self._clear_search_bar(who)
+                        raise UserNotFoundError(who)
+                    confirm()
+                    self._enter_chat(who,selected_contact)
+                input_box:WebElement=self._focus_input()
+                input_box.send_keys(message + Keys.ENTER)
+                pending=who,input_box
+            except Exception as e:
+                confirm()
+                self._current_chat=None
+                report(who,e)
+        confirm()
+        return results
+
+    def _broadcast_order(self,recipients:List[str])->List[str]:
+        recipients=list(dict.fromkeys(recipients))
+        return sorted(recipients,key=lambda who:(who!=self._current_chat,who not in self.directory))
+
+    def send_photo(self,who:str,photo:Union[bytes,str],caption:str)->NoReturn:
+        self.send_photos(who,[(photo,caption)])
+
+    @timed('send_photo')
+    def send_photos(self,who:str,photos:List[Tuple[Union[bytes,str],str]])->NoReturn:
+        staged:List[str]=[]
+        try:
+            paths:List[str]=[]
+            for photo,_caption in photos:
+                if isinstance(photo,str):
+                    paths.append(abspath(photo))
+                else:
+                    staged.append(self.staging.stage(photo,'.png'))
+                    paths.append(staged[-1])
+            self._send_photos(who,paths,[caption for _photo,caption in photos])
+        finally:
+            for path in staged:
+                self.staging.release(path)
+
+    def _send_photos(self,who:str,paths:List[str],captions:List[str])->NoReturn:
+        if len(paths)==0:
+            raise ValueError('No photos to send')
         self._select_chat(who)
-
         self.driver.find_element_by_xpath(ADD_FILE.format(CLIP)).click()
-        button:WebElement=WebDriverWait(self.driver,2)\
+        button:WebElement=self._wait(self.options.chat_timeout)\
             .until(lambda driver:self.driver.find_element_by_xpath(ADD_FILE.format(ATTACH_IMAGE)))
         inp:WebElement=button.find_element_by_xpath('./../input')
-        path:str=abspath(join(self.profile_dir,'.photo.png'))
-        with open(path,'wb') as f:
-            f.write(photo)
-        inp.send_keys(path)
-        WebDriverWait(self.driver, 2).until(lambda driver: self.driver.find_element_by_xpath(ADD_FILE.format(SEND)))
-        caption_bar=self.driver.find_element_by_xpath(INPUT_BOX)
-        caption_bar.send_keys(caption+Keys.ENTER)
-
-        self._select_chat(self._default_chat)
+        inp.send_keys('\n'.join(paths))
+        self._wait(self.options.send_timeout)\
+            .until(lambda driver: self.driver.find_element_by_xpath(ADD_FILE.format(SEND)))
+        thumbnails:List[WebElement]=[]
+        if len(paths)>1:
+            self._wait(self.options.send_timeout)\
+                .until(lambda driver:len(driver.find_elements_by_xpath(MEDIA_THUMB))>=len(paths))
+            thumbnails=self.driver.find_elements_by_xpath(MEDIA_THUMB)
+        caption_bar:Optional[WebElement]=None
+        for index,caption in enumerate(captions):
+            if len(caption)==0 and index<len(captions)-1:
+                continue
+            if len(thumbnails)>0:
+                thumbnails[index].click()
+            caption_bar=self._focus_input(CAPTION_BOX)
+            caption_bar.send_keys(caption)
+        caption_bar.send_keys(Keys.ENTER)
+        self._wait(self.options.send_timeout)\
+            .until_not(lambda driver:driver.find_element_by_xpath(ADD_FILE.format(SEND)))
 
     def _download_blob(self,url:str)->bytes:
-        result = self.driver.execute_async_script(
-            'var uri = arguments[0];'
-            'var callback = arguments[1];'
-            'var toBase64 = function(buffer){for(var r,n=new Uint8Array(buffer),'
-            't=n.length,a=new Uint8Array(4*Math.ceil(t/3)),i=new Uint8Array(64),o=0,c=0;64>c;++c)'
-            'i[c]="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/".charCodeAt(c);'
-            'for(c=0;t-t%3>c;c+=3,o+=4)r=n[c]<<16|n[c+1]<<8|n[c+2],a[o]=i[r>>18],'
-            'a[o+1]=i[r>>12&63],a[o+2]=i[r>>6&63],a[o+3]=i[63&r];'
-            'return t%3===1?(r=n[t-1],a[o]=i[r>>2],a[o+1]=i[r<<4&63],a[o+2]=61,a[o+3]=61):'
-            't%3===2&&(r=(n[t-2]<<8)+n[t-1],a[o]=i[r>>10],a[o+1]=i[r>>4&63],a[o+2]=i[r<<2&63],a[o+3]=61),'
-            'new TextDecoder("ascii").decode(a)};'
-            'var xhr = new XMLHttpRequest();'
-            "xhr.responseType = 'arraybuffer';"
-            'xhr.onload = function(){ callback(toBase64(xhr.response)) };'
-            'xhr.onerror = function(){ callback(xhr.status) };'
-            "xhr.open('GET', uri);"
-            'xhr.send();',url)
-        if type(result) == int:
-            raise Exception("Request failed with status %s" % result)
-        return b64decode(result)
+        return self._download_blobs([url])[url]
+
+    @timed('download_blob')
+    def fetch_media(self,media:List['Media'])->Dict[str,Exception]:
+        pending:List[Media]=[handle for handle in media if not handle.loaded]
+        errors:Dict[str,Exception]={}
+        blobs:Dict[str,bytes]=self._download_blobs([handle.url for handle in pending],errors)
+        for handle in pending:
+            if handle.url in blobs:
+                handle._load(blobs[handle.url])
+        return errors
+
+    def _download_blobs(self,urls:List[str],errors:Optional[Dict[str,Exception]]=None)->Dict[str,bytes]:
+        result:Dict[str,bytes]={}
+        missing:List[str]=[]
+        for url in dict.fromkeys(urls):
+            data:Optional[bytes]=self._blobs.get(url)
+            if data is None:
+                missing.append(url)
+            else:
+                result[url]=data
+        if len(missing)==0:
+            return result
+        try:
+            sizes:List[Dict[str,Any]]=self.driver.execute_async_script(FETCH_BLOBS,missing)
+            for url,size in zip(missing,sizes):
+                try:
+                    result[url]=b''.join(self._blob_chunks(url,size))
+                except Exception as e:
+                    if errors is None:
+                        raise
+                    errors[url]=e
+                    continue
+                self._blobs.put(url,result[url])
+        finally:
+            self.driver.execute_script(RELEASE_BLOBS,missing)
+        return result
+
+    def _stream_blob(self,url:str)->Iterator[bytes]:
+        data:Optional[bytes]=self._blobs.get(url)
+        if data is not None:
+            yield data
+            return
+        try:
+            yield from self._blob_chunks(url,self.driver.execute_async_script(FETCH_BLOBS,[url])[0])
+        finally:
+            self.driver.execute_script(RELEASE_BLOBS,[url])
+
+    def _blob_chunks(self,url:str,size:Dict[str,Any])->Iterator[bytes]:
+        if 'error' in size:
+            raise Exception("Request failed with status %s" % size['error'])
+        for offset in range(0,size['size'],self.options.blob_chunk_size):
+            chunk:Optional[str]=self.driver.execute_async_script(READ_BLOB_CHUNK,url,offset,
+                                                                  offset+self.options.blob_chunk_size)
+            if chunk is None:
+                raise Exception(f'Reading blob {url} failed at offset {offset}')
+            yield b64decode(chunk)
 
 class MessageType(Enum):
     TEXT=0
     AUDIO=1
     IMAGE=2
 
+SENDER_DIVS:Dict[MessageType,int]={MessageType.TEXT:4,MessageType.AUDIO:5,MessageType.IMAGE:6}
+
+class Media:
+    __slots__=('whatsapp','url','media_type','size','_data')
+
+    def __init__(self,whatsapp:Whatsapp,url:str,media_type:MessageType,size:Optional[int]=None):
+        self.whatsapp:Whatsapp=whatsapp
+        self.url:str=url
+        self.media_type:MessageType=media_type
+        self.size:Optional[int]=size
+        self._data:Optional[bytes]=None
+
+    loaded:bool=property(lambda self:self._data is not None)
+
+    def read(self)->bytes:
+        if self._data is None:
+            self._load(self.whatsapp._download_blob(self.url))
+        return self._data
+
+    def _load(self,data:bytes)->NoReturn:
+        self._data=data
+        self.size=len(data)
+
+    def stream(self)->Iterator[bytes]:
+        if self._data is not None:
+            yield self._data
+            return
+        yield from self.whatsapp._stream_blob(self.url)
+
+    def release(self)->NoReturn:
+        self._data=None
+
+    def __repr__(self):
+        return f'Media({self.media_type.name}, {self.url}, {self.size})'
+
 class Message:
-    def __init__(self,sender:str,message:Union[str,bytes,Tuple[str,bytes]],who:str=None,
-                 message_type:MessageType=MessageType.TEXT):
+    __slots__=('sender','text','who','message_type','message_id','media','time')
+
+    def __init__(self,sender:str,text:Optional[str],who:str=None,message_type:MessageType=MessageType.TEXT,
+                 message_id:Optional[str]=None,media:Optional[Media]=None,time:Optional[datetime]=None):
         self.sender:str=sender
-        self.message:Union[str,bytes,Tuple[str,bytes]]=message
+        self.text:Optional[str]=text
         self.message_type:MessageType=message_type
         self.who:Optional[str]=who
+        self.message_id:Optional[str]=message_id
+        self.media:Optional[Media]=media
+        self.time:Optional[datetime]=time
+
+    @property
+    def message(self)->Union[str,bytes,Tuple[str,bytes]]:
+        if self.message_type==MessageType.IMAGE:
+            return self.text,self.media.read()
+        if self.message_type==MessageType.AUDIO:
+            return self.media.read()
+        return self.text
 
     def __repr__(self):
         return str({'sender':self.sender,
-                    'message':self.message if self.message_type==MessageType.TEXT else self.message_type.name,
+                    'message':self.text if self.message_type==MessageType.TEXT else self.message_type.name,
                     'who':self.who})
 
 
-class ThreadStopError(Exception):
-    def __init__(self)->NoReturn:
-        super(ThreadStopError, self).__init__('The thread must be stopped')
+def count_unread(events:List[Dict[str,Any]],current_chat:Optional[str],
+                 new_messages:Dict[str,int])->Dict[str,int]:
+    result:Dict[str,int]={}
+    for event in events:
+        if event['type']==UNREAD:
+            result[event['who']]=event['count']
+    pending:Dict[str,int]=dict(new_messages)
+    if current_chat is not None:
+        pending[current_chat]=pending.get(current_chat,0)+\
+            len([event for event in events if event['type']==NEW_MESSAGE])
+    for who,count in pending.items():
+        result[who]=result.get(who,0)+count
+    return {who:count for who,count in result.items() if count>0}
+
+def _time_text(text:Optional[str])->Optional[str]:
+    if text is None or not text.startswith('[') or ']' not in text:
+        return None
+    return text[1:text.index(']')]
+
+def parse_time(text:Optional[str],time_format:Optional[str])->Optional[datetime]:
+    text=_time_text(text)
+    if text is None or time_format is None:
+        return None
+    try:
+        return datetime.strptime(text,time_format)
+    except ValueError:
+        return None
+
+def detect_time_format(texts:List[Optional[str]])->Optional[str]:
+    stamps:List[str]=[stamp for stamp in map(_time_text,texts) if stamp is not None]
+    if len(stamps)==0:
+        return None
+    candidates:List[str]=[time_format for time_format in TIME_FORMATS
+                          if all(parse_time(f'[{stamp}]',time_format) is not None for stamp in stamps)]
+    return candidates[0] if len(candidates)==1 else None
+
+def guess_time(text:Optional[str])->Optional[datetime]:
+    times:Set[datetime]={time for time in (parse_time(text,time_format) for time_format in TIME_FORMATS)
+                         if time is not None}
+    return times.pop() if len(times)==1 else None
 
 class UserNotFoundError(Exception):
     def __init__(self,who:str)->NoReturn:
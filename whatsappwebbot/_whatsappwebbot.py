@@ -1,43 +1,60 @@
 from telegram.ext import Updater,Dispatcher,CommandHandler,MessageHandler,Filters
 from .commands import COMMANDS
-from typing import List,NoReturn,Any,Dict,TextIO,Optional
-from .user import User,USERNAME,DEFAULT_CHAT_ID,ASSOCIATIONS,DEFAULT_CHAT
+from typing import NoReturn,TextIO,Optional,Callable,List,Any
+from .user import User,USERNAME,DEFAULT_CHAT_ID,ASSOCIATIONS,DEFAULT_CHAT,LAST_ACTIVE
 from logging import Logger,getLogger,StreamHandler,DEBUG,INFO
-from time import sleep
+from time import sleep,time
 from telegram.ext import CallbackContext
-from telegram import Update
-from .error import NoSuchUserError
-from os.path import exists,join
-from os import mkdir
-from json import dump,load
-from whatsapp import WhatsappOptions
-from io import StringIO
+from telegram import Update,PhotoSize
+from .error import NoSuchUserError,WhatsappNotLoggedInError
+from whatsapp import WhatsappOptions,SessionPool,MediaStaging,METRICS,is_headless
+from .logs import LogRing
 from threading import Thread
-
-USERS='users'
+from concurrent.futures import Future,ThreadPoolExecutor
+from .scheduler import PollScheduler
+from .egress import Egress
+from .lifecycle import Lifecycle
+from .registry import Registry
+from .storage import Storage
+from .metrics import MetricsServer
+from .album import AlbumCollector
 
 class WhatsappWebBot:
     def __init__(self,options:WhatsappOptions,token:str,data_dir:str,admin:int,stdout:Optional[TextIO],
                  silent_start:bool):
-        self.updater: Updater = Updater(token, use_context=True)
-        self.users:List[User]=[]
+        self.updater: Updater = Updater(token, base_url=options.telegram_api_url, use_context=True)
         self.silent_start:bool=silent_start
-        self.logs:StringIO=StringIO()
+        self.logs:LogRing=LogRing(options.log_capacity)
         self.logger:Logger=getLogger('WhatsappWebBot')
+        self.users:Registry=Registry(self.logger)
+        self.storage:Storage=Storage(data_dir,options.compact_every,options.compact_interval,self.logger)
         level:int=DEBUG if options.debug else INFO
         self.logger.setLevel(level)
-        handler:StreamHandler=StreamHandler(self.logs)
-        handler.setLevel(DEBUG)
-        self.logger.addHandler(StreamHandler(self.logs))
+        self.logs.attach(self.logger)
         if stdout is not None:
-            handler=StreamHandler(stdout)
+            handler:StreamHandler=StreamHandler(stdout)
             handler.setLevel(level)
-            self.logger.addHandler(StreamHandler(stdout))
+            self.logger.addHandler(handler)
         self.data_dir:str=data_dir
         self.admin:int=admin
         self._run:bool=True
         self.options:WhatsappOptions=options
         self._thread:Optional[Thread]=None
+        self._restore:ThreadPoolExecutor=ThreadPoolExecutor(max_workers=options.restore_workers,
+                                                            thread_name_prefix='restore')
+        self.pool:Optional[SessionPool]=SessionPool(options.interactive or is_headless(options.launch_profile),
+                                                                  options.show)\
+            if options.shared_session_pool else None
+        self.staging:MediaStaging=MediaStaging(options.staging_dir,options.staging_ttl,logger=self.logger)
+        self.albums:AlbumCollector=AlbumCollector(options.album_window,self._send_album,self.logger)
+        self.egress:Egress=Egress(self.updater.bot,options.telegram_workers,options.telegram_rate,
+                                  options.telegram_chat_rate,options.telegram_group_rate,options.coalesce_limit,
+                                  self.logger)
+        self.scheduler:PollScheduler=PollScheduler(options.poll_workers,options.poll_interval,
+                                                   options.max_poll_interval,options.poll_deadline,self.logger)
+        self.metrics_server:Optional[MetricsServer]=None
+        self.lifecycle:Lifecycle=Lifecycle(options.idle_timeout,options.wake_interval,options.lifecycle_workers,
+                                           self.logger)
         dispatcher: Dispatcher = self.updater.dispatcher
         dispatcher.add_handler(CommandHandler('start',self.start_command))
         for command in COMMANDS.keys():
@@ -47,12 +64,13 @@ class WhatsappWebBot:
         self.restore_all()
 
     def create_command_handler(self,command:str):
-        def method(update:Update,_context:CallbackContext):
+        def method(update:Update,context:CallbackContext):
             try:
                 user:User=self.find_user(update.message.from_user.id)
                 self.log(command,username=update.message.from_user.username,user=user)
-                COMMANDS[command](user)
-            except NoSuchUserError as exception:
+                user.touch()
+                COMMANDS[command](user,context.args or [])
+            except (NoSuchUserError,WhatsappNotLoggedInError) as exception:
                 self.log_error(exception,update.message.chat_id)
         return CommandHandler(command,method)
 
@@ -62,15 +80,18 @@ class WhatsappWebBot:
 
     def start(self):
         self.updater.start_polling()
+        if self.options.metrics_port is not None:
+            self.metrics_server=MetricsServer(METRICS,self.options.metrics_port)
+            self.logger.info(f'Serving metrics on port {self.options.metrics_port}')
         try:
-            self.logger.info('Started')
+            self.logger.info(f'Started with the {self.options.launch_profile} launch profile')
             self.logger.debug('Debug Mode On')
             if not self.silent_start:
                 self.notify_all('The bot is online')
             while self._run:
-                for user in self.users:
-                    user.receive_messages()
-                sleep(3)
+                with METRICS.time('loop',''):
+                    self._loop()
+                sleep(self.options.poll_interval)
         except KeyboardInterrupt:
             pass
         finally:
@@ -78,9 +99,29 @@ class WhatsappWebBot:
             if not self.silent_start:
                 self.notify_all('The bot is shutting down')
             self.updater.stop()
+            self.albums.close()
+            self._restore.shutdown(wait=True,cancel_futures=True)
+            self.scheduler.close()
+            self.lifecycle.close()
+            self.egress.close()
             self.save_all()
+            self.storage.close()
             for user in self.users:
                 user.close()
+            if self.pool is not None:
+                self.pool.close()
+            self.staging.close()
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+
+    def _loop(self)->NoReturn:
+        if self.storage.due:
+            try:
+                self.save_all()
+            except Exception as e:
+                self.logger.error(f'Saving the users failed, the journal is kept: {e}',exc_info=True)
+        self.lifecycle.tick(list(self.users))
+        self.scheduler.poll([user for user in self.users if user.awake])
 
     def stop(self):
         self._run=False
@@ -90,27 +131,77 @@ class WhatsappWebBot:
     def on_message(self,update: Update, _context: CallbackContext) -> NoReturn:
         try:
             user: User = self.find_user(update.message.from_user.id)
+            user.touch()
             if user.current_mode is not None:
                 user.current_mode(user,update.message)
                 user.current_mode = None
             else:
-                user.send_message(update.message.chat_id, update.message.text)
+                user.send_message(update.message.chat_id, update.message.text)\
+                    .add_done_callback(self._acknowledge(update))
         except NoSuchUserError as e:
             self.log_error(e,update.message.chat_id)
 
     def on_photo(self,update:Update, _context:CallbackContext)->NoReturn:
         try:
             user:User=self.find_user(update.message.from_user.id)
-            user.send_photo(update.message.chat_id,update.message.photo[0].get_file().download_as_bytearray(),
-                            '' if update.message.caption is None else update.message.caption)
+            user.touch()
+            if update.message.media_group_id is not None:
+                self.albums.add((user.username,update.message.chat_id,update.message.media_group_id),update)
+                return
+            path:str=self._stage_photo(update)
+            try:
+                future:Future=user.send_photo(update.message.chat_id,path,caption(update))
+            except Exception:
+                self.staging.release(path)
+                raise
+            future.add_done_callback(lambda _future:self.staging.release(path))
+            future.add_done_callback(self._acknowledge(update))
 
         except NoSuchUserError as e:
             self.log_error(e,update.message.chat_id)
 
+    def _send_album(self,updates:List[Update])->NoReturn:
+        updates=sorted(updates,key=lambda update:update.message.message_id)
+        first:Update=updates[0]
+        paths:List[str]=[]
+        try:
+            user:User=self.find_user(first.message.from_user.id)
+            for update in updates:
+                paths.append(self._stage_photo(update))
+            future:Future=user.send_photos(first.message.chat_id,
+                                           [(path,caption(update)) for path,update in zip(paths,updates)])
+        except Exception as e:
+            for path in paths:
+                self.staging.release(path)
+            self.log_error(e,first.message.chat_id)
+            return
+        self.logger.debug(f'Queued an album of {len(updates)} photos from {first.message.from_user.id}')
+        for path in paths:
+            future.add_done_callback(lambda _future,path=path:self.staging.release(path))
+        for update in updates:
+            future.add_done_callback(self._acknowledge(update))
+
+    def _stage_photo(self,update:Update)->str:
+        photo:PhotoSize=choose_photo(update.message.photo,self.options.photo_max_side)
+        return self.staging.stage_stream(lambda out:photo.get_file().download(out=out),'.jpg')
+
+    def _acknowledge(self,update:Update)->Callable[[Future],NoReturn]:
+        def method(future:Future):
+            exception:Optional[BaseException]=future.exception()
+            if exception is None:
+                self.logger.debug(f'Message {update.message.message_id} delivered to {future.result()}')
+            else:
+                self.log_error(exception,update.message.chat_id)
+        return method
+
     def start_command(self,update: Update, _context: CallbackContext) -> NoReturn:
         username: int = update.message.from_user.id
         chat_id: int = update.message.chat_id
         self.log('start', username=username, chat_id=chat_id)
+        if username in self.users:
+            self.users.find(username).reply(f'Your username is {username} and the session is already started',
+                                            update.message)
+            return
         user: User = User(self, username, chat_id)
         user.reply(f'Your username is {username} with chat id {chat_id}', update.message)
 
@@ -118,35 +209,39 @@ class WhatsappWebBot:
             user.log('Log in successful')
 
         user.whatsapp.logged_in_callback = logged_in
-        self.users.append(user)
+        self.users.add(user)
 
     def save_all(self):
-        if not exists(self.data_dir):
-            mkdir(self.data_dir)
-        with open(self.data_file(), 'w') as f:
-            dump({USERS: [user.as_dict() for user in self.users]}, f)
+        self.users.compact(self.storage)
 
     def restore_all(self):
-        if not exists(self.data_file()):
-            return
-        with open(self.data_file(), 'r') as f:
-            data: Dict[str, Any] = load(f)
-            for user in data[USERS]:
-                self.users.append(User(self, user[USERNAME], user[DEFAULT_CHAT_ID], user[ASSOCIATIONS],
-                                       user[DEFAULT_CHAT]))
+        for user in self.storage.load():
+            self.users.add(User(self, user[USERNAME], user[DEFAULT_CHAT_ID], user[ASSOCIATIONS],
+                                user[DEFAULT_CHAT], False, user.get(LAST_ACTIVE)))
+        self.users.storage=self.storage
+        now:float=time()
+        for user in sorted(self.users,key=lambda user:user.last_active,reverse=True):
+            if not self.lifecycle.enabled or now-user.last_active<self.options.idle_timeout:
+                self._restore.submit(self._restore_session,user)
+
+    def _restore_session(self,user:User)->NoReturn:
+        try:
+            user.wake()
+        except Exception as e:
+            self.logger.error(f'Restoring the session of user {user.username} failed: {e}',exc_info=True)
+
+    def submit(self,task:Callable[[],Any])->Future:
+        return self._restore.submit(task)
 
     def notify_all(self,message: str):
         for user in self.users:
             user.log(message)
 
     def find_user(self,username: int) -> User:
-        for user in self.users:
-            if user.username == username:
-                return user
-        raise NoSuchUserError(username)
+        return self.users.find(username)
 
     def data_file(self)->str:
-        return join(self.data_dir,'data.json')
+        return self.storage.snapshot_file
 
     def log(self,command: str, **kwargs):
         message: str = f'/{command}'
@@ -157,3 +252,13 @@ class WhatsappWebBot:
     def log_error(self,exception:Exception,chat_id:int):
         self.logger.error(str(exception), exc_info=True)
         self.updater.bot.send_message(chat_id,str(exception))
+
+def caption(update:Update)->str:
+    return '' if update.message.caption is None else update.message.caption
+
+def choose_photo(photos:List[PhotoSize],max_side:Optional[int])->PhotoSize:
+    photos=sorted(photos,key=lambda photo:photo.width*photo.height)
+    if max_side is None:
+        return photos[-1]
+    fitting:List[PhotoSize]=[photo for photo in photos if max(photo.width,photo.height)<=max_side]
+    return fitting[-1] if len(fitting)>0 else photos[0]
@@ -0,0 +1 @@
+from ._album import AlbumCollector
@@ -0,0 +1,45 @@
+from typing import Dict,List,Callable,NoReturn,Hashable,Any,Union
+from threading import Timer,Lock
+from logging import Logger,LoggerAdapter
+
+class AlbumCollector:
+    def __init__(self,window:float,flush:Callable[[List[Any]],NoReturn],logger:Union[Logger,LoggerAdapter]):
+        self.window:float=window
+        self._flush:Callable[[List[Any]],NoReturn]=flush
+        self.logger:Union[Logger,LoggerAdapter]=logger
+        self._albums:Dict[Hashable,List[Any]]={}
+        self._timers:Dict[Hashable,Timer]={}
+        self._lock:Lock=Lock()
+
+    def add(self,key:Hashable,item:Any)->NoReturn:
+        with self._lock:
+            self._albums.setdefault(key,[]).append(item)
+            timer:Timer=self._timers.pop(key,None)
+            if timer is not None:
+                timer.cancel()
+            timer=Timer(self.window,self.flush,(key,))
+            timer.daemon=True
+            self._timers[key]=timer
+            timer.start()
+
+    def flush(self,key:Hashable)->NoReturn:
+        with self._lock:
+            items:List[Any]=self._albums.pop(key,[])
+            timer:Timer=self._timers.pop(key,None)
+            if timer is not None:
+                timer.cancel()
+        if len(items)==0:
+            return
+        try:
+            self._flush(items)
+        except Exception as e:
+            self.logger.error(f'Sending the album {key} failed: {e}',exc_info=True)
+
+    def close(self)->NoReturn:
+        with self._lock:
+            keys:List[Hashable]=list(self._albums.keys())
+        for key in keys:
+            self.flush(key)
+
+    def __len__(self)->int:
+        return len(self._albums)
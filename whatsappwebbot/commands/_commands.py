@@ -1,17 +1,28 @@
 from telegram.message import Message
-from typing import List,Dict
+from typing import List,Dict,Optional,Tuple,Callable
+from logging import NOTSET,getLevelName
 from whatsappwebbot.user import User
-from whatsappwebbot.error import WhatsappUserNotFoundError
+from whatsappwebbot.error import WhatsappUserNotFoundError,AssociationConflictError
 from io import BytesIO
+from os.path import exists
+from concurrent.futures import Future
+from whatsapp import METRICS,Histogram,Whatsapp
 from whatsappwebbot.commands._defaults import create_set_mode,Command
 
+MEGABYTE=1024*1024
+USER_FILTER='user='
+STATS_TOP_USERS=5
+BROADCAST_ALL='all'
+BROADCAST_PROGRESS=10
+SNAPSHOT_RESTORE='restore'
+
 def associate(user:User,message:Message):
     try:
         who:str=message.text
         chat_id:int=message.chat_id
         user.add_association(who,chat_id)
         user.reply('The association was successful',message)
-    except WhatsappUserNotFoundError as e:
+    except (WhatsappUserNotFoundError,AssociationConflictError) as e:
         user.log_error(e)
 
 def associate_with_list(user:User,message:Message):
@@ -20,20 +31,139 @@ def associate_with_list(user:User,message:Message):
             pieces:List[str]=line.split(': ')
             user.add_association(pieces[0],int(pieces[1]))
         user.reply('The association was successful',message)
-    except WhatsappUserNotFoundError as e:
+    except (WhatsappUserNotFoundError,AssociationConflictError) as e:
         user.log_error(e)
 
-def stop(user:User):
+def broadcast(user:User,message:Message):
+    lines:List[str]=message.text.split('\n',1)
+    if len(lines)<2 or len(lines[1].strip())==0:
+        user.reply('Write the recipients separated by commas (or all for every association) on the first line '
+                   'and the message on the following lines',message)
+        return
+    recipients:List[str]=list(user.associations.keys()) if lines[0].strip().lower()==BROADCAST_ALL else\
+        list(dict.fromkeys(who.strip() for who in lines[0].split(',') if len(who.strip())>0))
+    results:Dict[str,Optional[Exception]]={}
+
+    def progress(who:str,error:Optional[Exception]):
+        results[who]=error
+        if len(results)%BROADCAST_PROGRESS==0 and len(results)<len(recipients):
+            user.post(f'Broadcast: {len(results)}/{len(recipients)} done')
+
+    def done(future:Future):
+        if future.exception() is not None:
+            user.log_error(future.exception())
+            return
+        failed:Dict[str,Exception]={who:error for who,error in results.items() if error is not None}
+        user.post(f'Broadcast to {len(results)} recipients: {len(results)-len(failed)} sent, {len(failed)} failed'
+                  +''.join(f'\n{who}: {error}' for who,error in failed.items()))
+
+    user.broadcast(recipients,lines[1],progress).add_done_callback(done)
+
+def stop(user:User,_args:List[str]):
     user.delete_user()
     user.log('Stopped')
 
-def show_logs(user:User):
-    if user.username == user.whatsappwebbot.admin:
-        user.log(user.whatsappwebbot.logs.getvalue())
+def show_logs(user:User,args:List[str]):
+    if user.username != user.whatsappwebbot.admin:
+        user.log(f'User {user.username} is not authorized for this command')
+        return
+    level:int=NOTSET
+    username:Optional[int]=None
+    page:int=1
+    try:
+        for arg in args:
+            if arg.isdigit():
+                page=int(arg)
+                if page<1:
+                    raise ValueError(arg)
+            elif arg.startswith(USER_FILTER):
+                username=int(arg[len(USER_FILTER):])
+            elif isinstance(getLevelName(arg.upper()),int):
+                level=getLevelName(arg.upper())
+            else:
+                raise ValueError(arg)
+    except ValueError as e:
+        user.log(f'Invalid argument {e}, usage: /logs [level] [user=<id>] [page]')
+        return
+    pages:List[str]=user.whatsappwebbot.logs.pages(level,username)
+    if len(pages)==0:
+        user.log('None')
+    elif page>len(pages):
+        user.log(f'There are only {len(pages)} pages')
     else:
+        user.log(pages[page-1])
+
+def show_memory(user:User,_args:List[str]):
+    if user.username != user.whatsappwebbot.admin:
         user.log(f'User {user.username} is not authorized for this command')
+        return
+    message:str=''
+    total:int=0
+    for other in user.whatsappwebbot.users:
+        session:Optional[Whatsapp]=other.session
+        if session is None:
+            message+=f'{other.username}: hibernated\n'
+            continue
+        usage:Dict[str,int]=session.memory_usage()
+        total+=sum(usage.values())
+        message+=f'{other.username}: '+', '.join(f'{key} {value//MEGABYTE} MB' for key,value in usage.items())+'\n'
+    if user.whatsappwebbot.pool is not None:
+        usage:Dict[str,int]=user.whatsappwebbot.pool.memory_usage()
+        total+=sum(usage.values())
+        message+='shared: '+', '.join(f'{key} {value//MEGABYTE} MB' for key,value in usage.items())+'\n'
+    sessions:int=max(len([other for other in user.whatsappwebbot.users if other.awake]),1)
+    message+=f'total {total//MEGABYTE} MB, {total//sessions//MEGABYTE} MB per session'
+    user.log(message)
+
+def show_stats(user:User,_args:List[str]):
+    if user.username != user.whatsappwebbot.admin:
+        user.log(f'User {user.username} is not authorized for this command')
+        return
+    message:str=''
+    for operation,histogram in sorted(METRICS.by_operation().items()):
+        message+=f'{operation}: {histogram.count} calls, avg {histogram.sum/histogram.count:.3f}s, ' \
+                 f'p50 {histogram.quantile(0.5)}s, p99 {histogram.quantile(0.99)}s\n'
+    users:List[Tuple[str,Histogram]]=sorted(METRICS.by_user('poll').items(),key=lambda item:item[1].sum,
+                                            reverse=True)[:STATS_TOP_USERS]
+    if len(users)>0:
+        message+='Slowest users by poll time:\n'
+        for username,histogram in users:
+            message+=f'{username}: {histogram.sum:.1f}s in {histogram.count} polls, ' \
+                     f'p99 {histogram.quantile(0.99)}s\n'
+    user.log(message if len(message)>0 else 'None')
+
+def compact(user:User,_args:List[str]):
+    def task()->str:
+        before,after,startup,restarted=user.compact_profile()
+        return f'Profile compacted from {before//MEGABYTE} MB to {after//MEGABYTE} MB, '\
+               f'startup {format_startup(startup)} before and {format_startup(restarted)} after'
+    in_background(user,task)
+
+def snapshot(user:User,args:List[str]):
+    if len(args)==0:
+        in_background(user,lambda:f'Snapshot taken, {user.snapshot()//1024} KB, '
+                                  f'restore it with /snapshot {SNAPSHOT_RESTORE}')
+    elif args==[SNAPSHOT_RESTORE]:
+        if not exists(user.snapshot_file()):
+            user.log('There is no snapshot, take one with /snapshot')
+            return
+        in_background(user,lambda:f'Profile restored from the snapshot, '
+                                  f'startup {format_startup(user.restore_snapshot())}')
+    else:
+        user.log(f'Invalid arguments, usage: /snapshot [{SNAPSHOT_RESTORE}]')
+
+def in_background(user:User,task:Callable[[],str]):
+    def method():
+        try:
+            user.log(task())
+        except Exception as e:
+            user.log_error(e)
+    user.whatsappwebbot.submit(method)
+
+def format_startup(startup:Optional[float])->str:
+    return 'not measured' if startup is None else f'{startup:.1f}s'
 
-def list_associations(user:User):
+def list_associations(user:User,_args:List[str]):
     message: str = ''
     for association in user.associations.keys():
         message += association + ': ' + str(user.associations[association])
@@ -41,10 +171,10 @@ def list_associations(user:User):
         message = 'None'
     user.log(message)
 
-def show_default_chat(user:User):
+def show_default_chat(user:User,_args:List[str]):
     user.log(user.default_chat)
 
-def take_screenshot(user:User):
+def take_screenshot(user:User,_args:List[str]):
     user.log_photo(BytesIO(user.whatsapp.driver.get_screenshot_as_png()))
 
 def set_default_chat(user:User,message:Message):
@@ -55,8 +185,13 @@ def set_default_chat(user:User,message:Message):
 COMMANDS:Dict[str,Command]={'stop':stop,
                             'logs':show_logs,
                             'screenshot':take_screenshot,
+                            'memory':show_memory,
+                            'stats':show_stats,
+                            'compact':compact,
+                            'snapshot':snapshot,
                             'associate':create_set_mode(associate),
                             'associate_with_list':create_set_mode(associate_with_list),
                             'set_default_chat':create_set_mode(set_default_chat),
+                            'broadcast':create_set_mode(broadcast),
                             'associations':list_associations,
                             'show_default_chat':show_default_chat}
@@ -1,10 +1,10 @@
-from typing import Callable,NoReturn
+from typing import Callable,NoReturn,List
 from whatsappwebbot.user import User
 from telegram.message import Message
 
-Command=Callable[[User],NoReturn]
+Command=Callable[[User,List[str]],NoReturn]
 
 def create_set_mode(mode:Callable[[User,Message],NoReturn])->Command:
-    def method(user:User):
+    def method(user:User,_args:List[str]):
         user.current_mode = mode
     return method
@@ -0,0 +1 @@
+from ._egress import Egress,TokenBucket
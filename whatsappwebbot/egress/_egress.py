@@ -0,0 +1,160 @@
+from concurrent.futures import Future
+from collections import deque
+from threading import Thread,Condition,Lock
+from typing import NoReturn,Optional,List,Deque,Dict,Any
+from logging import Logger
+from time import monotonic,sleep
+from io import BytesIO
+from telegram import Bot
+from telegram.error import RetryAfter
+from whatsapp import MessageType,METRICS
+
+MAX_MESSAGE_LENGTH=4096
+MAX_RETRIES=5
+
+class TokenBucket:
+    def __init__(self,rate:float,capacity:float):
+        self.rate:float=rate
+        self.capacity:float=capacity
+        self._tokens:float=capacity
+        self._updated:float=monotonic()
+        self._lock:Lock=Lock()
+
+    def reserve(self)->float:
+        with self._lock:
+            now:float=monotonic()
+            self._tokens=min(self.capacity,self._tokens+(now-self._updated)*self.rate)
+            self._updated=now
+            self._tokens-=1
+            return 0 if self._tokens>=0 else -self._tokens/self.rate
+
+    def acquire(self)->NoReturn:
+        delay:float=self.reserve()
+        if delay>0:
+            sleep(delay)
+
+class _Outgoing:
+    def __init__(self,chat_id:int,message_type:MessageType,text:str,data:Optional[bytes],user:Optional[int]):
+        self.chat_id:int=chat_id
+        self.user:Optional[int]=user
+        self.message_type:MessageType=message_type
+        self.text:str=text
+        self.data:Optional[bytes]=data
+        self.futures:List[Future]=[Future()]
+
+class _Worker:
+    def __init__(self,egress:'Egress',name:str):
+        self.egress:Egress=egress
+        self.queue:Deque[_Outgoing]=deque()
+        self.condition:Condition=Condition()
+        self.running:bool=True
+        self.thread:Thread=Thread(target=self._run,name=name,daemon=True)
+        self.thread.start()
+
+    def put(self,outgoing:_Outgoing)->NoReturn:
+        with self.condition:
+            self.queue.append(outgoing)
+            self.condition.notify()
+
+    def _take(self)->Optional[_Outgoing]:
+        with self.condition:
+            while self.running and len(self.queue)==0:
+                self.condition.wait()
+            if len(self.queue)==0:
+                return None
+            outgoing:_Outgoing=self.queue.popleft()
+            if self.egress.coalesce_limit>0 and outgoing.message_type==MessageType.TEXT:
+                while len(self.queue)>0 and self.egress.can_coalesce(outgoing,self.queue[0]):
+                    following:_Outgoing=self.queue.popleft()
+                    outgoing.text+='\n'+following.text
+                    outgoing.futures.extend(following.futures)
+            return outgoing
+
+    def _run(self)->NoReturn:
+        while True:
+            outgoing:Optional[_Outgoing]=self._take()
+            if outgoing is None:
+                return
+            futures:List[Future]=[future for future in outgoing.futures if future.set_running_or_notify_cancel()]
+            try:
+                result:Any=self.egress.deliver(outgoing)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(result)
+
+    def close(self)->NoReturn:
+        with self.condition:
+            self.running=False
+            self.condition.notify()
+        self.thread.join()
+
+class Egress:
+    def __init__(self,bot:Bot,workers:int,rate:float,chat_rate:float,group_rate:float,coalesce_limit:int,
+                 logger:Logger):
+        self.bot:Bot=bot
+        self.logger:Logger=logger
+        self.coalesce_limit:int=coalesce_limit
+        self.chat_rate:float=chat_rate
+        self.group_rate:float=group_rate
+        self._bucket:TokenBucket=TokenBucket(rate,rate)
+        self._chat_buckets:Dict[int,TokenBucket]={}
+        self._lock:Lock=Lock()
+        self._workers:List[_Worker]=[_Worker(self,f'telegram-egress-{i}') for i in range(workers)]
+
+    def send_message(self,chat_id:int,text:str,user:Optional[int]=None)->Future:
+        return self._put(_Outgoing(chat_id,MessageType.TEXT,text,None,user))
+
+    def send_audio(self,chat_id:int,audio:bytes,caption:str,user:Optional[int]=None)->Future:
+        return self._put(_Outgoing(chat_id,MessageType.AUDIO,caption,audio,user))
+
+    def send_photo(self,chat_id:int,photo:bytes,caption:str,user:Optional[int]=None)->Future:
+        return self._put(_Outgoing(chat_id,MessageType.IMAGE,caption,photo,user))
+
+    def _put(self,outgoing:_Outgoing)->Future:
+        self._workers[outgoing.chat_id%len(self._workers)].put(outgoing)
+        return outgoing.futures[0]
+
+    def can_coalesce(self,outgoing:_Outgoing,following:_Outgoing)->bool:
+        return following.chat_id==outgoing.chat_id and following.user==outgoing.user and \
+            following.message_type==MessageType.TEXT and len(following.text)<=self.coalesce_limit and \
+            len(outgoing.text)+len(following.text)+1<=MAX_MESSAGE_LENGTH
+
+    def _chat_bucket(self,chat_id:int)->TokenBucket:
+        with self._lock:
+            if chat_id not in self._chat_buckets:
+                rate:float=self.group_rate if chat_id<0 else self.chat_rate
+                self._chat_buckets[chat_id]=TokenBucket(rate,1)
+            return self._chat_buckets[chat_id]
+
+    def deliver(self,outgoing:_Outgoing)->Any:
+        retries:int=0
+        while True:
+            self._chat_bucket(outgoing.chat_id).acquire()
+            self._bucket.acquire()
+            try:
+                with METRICS.time(f'telegram_send_{outgoing.message_type.name.lower()}',
+                                  '' if outgoing.user is None else str(outgoing.user)):
+                    return self._send(outgoing)
+            except RetryAfter as e:
+                retries+=1
+                if retries>MAX_RETRIES:
+                    raise
+                self.logger.warning(f'Telegram flood limit for chat {outgoing.chat_id}, '
+                                    f'retrying in {e.retry_after}s')
+                sleep(e.retry_after)
+
+    def _send(self,outgoing:_Outgoing)->Any:
+        if outgoing.message_type==MessageType.TEXT:
+            return self.bot.send_message(outgoing.chat_id,outgoing.text)
+        elif outgoing.message_type==MessageType.AUDIO:
+            return self.bot.send_audio(outgoing.chat_id,BytesIO(outgoing.data),caption=outgoing.text)
+        elif outgoing.message_type==MessageType.IMAGE:
+            return self.bot.send_photo(outgoing.chat_id,BytesIO(outgoing.data),caption=outgoing.text)
+        raise NotImplementedError(f'Message type {outgoing.message_type.name} not supported')
+
+    def close(self)->NoReturn:
+        for worker in self._workers:
+            worker.close()
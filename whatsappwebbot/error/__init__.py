@@ -1 +1 @@
-from ._error import WhatsappUserNotFoundError,NoSuchUserError
+from ._error import WhatsappUserNotFoundError,NoSuchUserError,WhatsappNotLoggedInError,AssociationConflictError
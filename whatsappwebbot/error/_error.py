@@ -7,3 +7,11 @@ class NoSuchUserError(Exception):
 class WhatsappUserNotFoundError(Exception):
     def __init__(self,username:str):
         super(WhatsappUserNotFoundError, self).__init__(f'Whatsapp user {username} not found, is it right')
+
+class WhatsappNotLoggedInError(Exception):
+    def __init__(self,username:int):
+        super(WhatsappNotLoggedInError, self).__init__(f'The whatsapp session of user {username} is not logged in')
+
+class AssociationConflictError(Exception):
+    def __init__(self,chat_id:int,owner:str):
+        super(AssociationConflictError, self).__init__(f'The chat {chat_id} is already associated with {owner}')
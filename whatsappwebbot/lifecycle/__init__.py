@@ -0,0 +1 @@
+from ._lifecycle import Lifecycle
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor,Future
+from typing import Dict,Optional,NoReturn,Iterable,Callable
+from logging import Logger
+from time import time
+from whatsapp import Whatsapp
+from whatsappwebbot.user import User
+from whatsappwebbot.logs import USER
+
+class Lifecycle:
+    def __init__(self,idle_timeout:Optional[float],wake_interval:Optional[float],workers:int,logger:Logger):
+        self.idle_timeout:Optional[float]=idle_timeout
+        self.wake_interval:Optional[float]=wake_interval
+        self.logger:Logger=logger
+        self._executor:ThreadPoolExecutor=ThreadPoolExecutor(max_workers=workers,thread_name_prefix='lifecycle')
+        self._pending:Dict[int,Future]={}
+        self._woken:Dict[int,float]={}
+
+    enabled:bool=property(lambda self:self.idle_timeout is not None)
+
+    def tick(self,users:Iterable[User])->NoReturn:
+        if not self.enabled:
+            return
+        now:float=time()
+        for user in users:
+            future:Optional[Future]=self._pending.get(user.username)
+            if future is not None and not future.done():
+                continue
+            session:Optional[Whatsapp]=user.session
+            if session is not None:
+                idle:float=now-max(user.last_active,user.session_started or 0)
+                if idle>=self.idle_timeout and session.logged_in and user.outbox.idle:
+                    self.logger.info(f'User {user.username} is idle, hibernating the session',
+                                     extra={USER:user.username})
+                    self._submit(user,user.hibernate)
+            elif self.wake_interval is not None and \
+                    now-self._woken.get(user.username,user.last_active)>=self.wake_interval:
+                self.logger.debug(f'Waking user {user.username} to check for unread messages',
+                                  extra={USER:user.username})
+                self._woken[user.username]=now
+                self._submit(user,user.wake)
+
+    def _submit(self,user:User,method:Callable[[],object])->NoReturn:
+        future:Future=self._executor.submit(method)
+        future.add_done_callback(self._done(user))
+        self._pending[user.username]=future
+
+    def _done(self,user:User)->Callable[[Future],NoReturn]:
+        def method(future:Future):
+            exception:Optional[BaseException]=future.exception()
+            if exception is not None:
+                self.logger.error(f'Lifecycle change of user {user.username} failed: {exception}',
+                                  exc_info=exception,extra={USER:user.username})
+        return method
+
+    def close(self)->NoReturn:
+        self._executor.shutdown(wait=True)
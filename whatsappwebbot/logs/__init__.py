@@ -0,0 +1 @@
+from ._logs import LogRing,LogEntry,USER
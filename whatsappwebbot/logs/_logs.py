@@ -0,0 +1,70 @@
+from logging import Handler,LogRecord,NOTSET,DEBUG,getLevelName,Logger
+from collections import deque
+from threading import Lock
+from datetime import datetime
+from typing import Deque,List,Optional,NoReturn
+
+USER='user'
+MAX_MESSAGE_LENGTH=4096
+PAGE_HEADER='Page {}/{}\n'
+
+class LogEntry:
+    __slots__=('created','level','user','message')
+
+    def __init__(self,created:float,level:int,user:Optional[int],message:str):
+        self.created:float=created
+        self.level:int=level
+        self.user:Optional[int]=user
+        self.message:str=message
+
+    def __str__(self)->str:
+        return f'{datetime.fromtimestamp(self.created):%Y-%m-%d %H:%M:%S} {getLevelName(self.level)} ' \
+               f'{"" if self.user is None else f"[{self.user}] "}{self.message}'
+
+class LogRing(Handler):
+    def __init__(self,capacity:int,level:int=DEBUG):
+        super(LogRing, self).__init__(level)
+        self._entries:Deque[LogEntry]=deque(maxlen=capacity)
+        self._entries_lock:Lock=Lock()
+
+    def emit(self,record:LogRecord)->NoReturn:
+        user:Optional[int]=getattr(record,USER,None)
+        if user is None and record.name.isdigit():
+            user=int(record.name)
+        try:
+            message:str=record.getMessage()
+            if record.exc_info:
+                message+=f' ({record.exc_info[1]!r})'
+        except Exception:
+            self.handleError(record)
+            return
+        with self._entries_lock:
+            self._entries.append(LogEntry(record.created,record.levelno,user,message))
+
+    def attach(self,logger:Logger)->NoReturn:
+        if self not in logger.handlers:
+            logger.addHandler(self)
+
+    def query(self,level:int=NOTSET,user:Optional[int]=None)->List[LogEntry]:
+        with self._entries_lock:
+            return [entry for entry in self._entries if entry.level>=level and (user is None or entry.user==user)]
+
+    def pages(self,level:int=NOTSET,user:Optional[int]=None,size:int=MAX_MESSAGE_LENGTH)->List[str]:
+        size-=len(PAGE_HEADER.format(0,0))+8
+        pages:List[List[str]]=[]
+        page:List[str]=[]
+        length:int=0
+        for entry in reversed(self.query(level,user)):
+            line:str=str(entry)[:size]
+            if length+len(line)+1>size:
+                pages.append(page)
+                page=[]
+                length=0
+            page.append(line)
+            length+=len(line)+1
+        if len(page)>0:
+            pages.append(page)
+        return [PAGE_HEADER.format(i+1,len(pages))+'\n'.join(reversed(page)) for i,page in enumerate(pages)]
+
+    def __len__(self)->int:
+        return len(self._entries)
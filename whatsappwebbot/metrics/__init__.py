@@ -0,0 +1 @@
+from ._metrics import MetricsServer
@@ -0,0 +1,36 @@
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from threading import Thread
+from typing import NoReturn,Type
+from whatsapp import Metrics
+
+CONTENT_TYPE='text/plain; version=0.0.4'
+PATH='/metrics'
+LOCALHOST='127.0.0.1'
+
+def _create_handler(metrics:Metrics)->Type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path!=PATH:
+                self.send_error(404)
+                return
+            body:bytes=metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type',CONTENT_TYPE)
+            self.send_header('Content-Length',str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self,format:str,*args)->NoReturn:
+            pass
+    return Handler
+
+class MetricsServer:
+    def __init__(self,metrics:Metrics,port:int,host:str=LOCALHOST):
+        self.server:ThreadingHTTPServer=ThreadingHTTPServer((host,port),_create_handler(metrics))
+        self._thread:Thread=Thread(target=self.server.serve_forever,name='metrics-server',daemon=True)
+        self._thread.start()
+
+    def close(self)->NoReturn:
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
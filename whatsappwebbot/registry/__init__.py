@@ -0,0 +1 @@
+from ._registry import Registry
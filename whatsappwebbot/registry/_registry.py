@@ -0,0 +1,104 @@
+from typing import Dict,Optional,Tuple,Iterator,NoReturn,List
+from threading import RLock
+from logging import Logger
+from whatsappwebbot.user import User
+from whatsappwebbot.error import NoSuchUserError,AssociationConflictError
+from whatsappwebbot.storage import Storage
+
+class Registry:
+    def __init__(self,logger:Logger):
+        self.logger:Logger=logger
+        self._users:Dict[int,User]={}
+        self._chats:Dict[int,Tuple[User,Optional[str]]]={}
+        self._lock:RLock=RLock()
+        self.storage:Optional[Storage]=None
+
+    def add(self,user:User)->NoReturn:
+        with self._lock:
+            if user.username in self._users:
+                raise ValueError(f'User {user.username} is already registered')
+            self._users[user.username]=user
+            if user.default_chat_id not in self._chats:
+                self._chats[user.default_chat_id]=user,None
+            for who,chat_id in user.associations.items():
+                owner:Optional[User]=self._owner(chat_id)
+                if owner is not None and owner is not user:
+                    self.logger.warning(f'Chat {chat_id} of the association {who} of user {user.username} is '
+                                        f'already used by user {owner.username}, messages from it go to the latter')
+                    continue
+                self._chats[chat_id]=user,who
+            if self.storage is not None:
+                self.storage.user_added(user.as_dict())
+
+    def remove(self,user:User)->NoReturn:
+        with self._lock:
+            if self._users.get(user.username) is not user:
+                return
+            del self._users[user.username]
+            for chat_id in [chat_id for chat_id,(owner,_) in self._chats.items() if owner is user]:
+                del self._chats[chat_id]
+            for other in self._users.values():
+                for chat_id in set(other.associations.values())|{other.default_chat_id}:
+                    if chat_id not in self._chats:
+                        self._reindex(other,chat_id)
+            if self.storage is not None:
+                self.storage.user_deleted(user.username)
+
+    def find(self,username:int)->User:
+        try:
+            return self._users[username]
+        except KeyError:
+            raise NoSuchUserError(username)
+
+    def find_chat(self,chat_id:int)->Optional[Tuple[User,Optional[str]]]:
+        return self._chats.get(chat_id)
+
+    def contact(self,user:User,chat_id:int)->Optional[str]:
+        entry:Optional[Tuple[User,Optional[str]]]=self._chats.get(chat_id)
+        return entry[1] if entry is not None and entry[0] is user else None
+
+    def associate(self,user:User,who:str,chat_id:int)->NoReturn:
+        with self._lock:
+            owner:Optional[User]=self._owner(chat_id)
+            if owner is not None and owner is not user:
+                raise AssociationConflictError(chat_id,f'user {owner.username}')
+            previous:Optional[int]=user.associations.get(who)
+            user.associations[who]=chat_id
+            self._chats[chat_id]=user,who
+            if previous is not None and previous!=chat_id:
+                self._reindex(user,previous)
+            if self.storage is not None:
+                self.storage.association_set(user.username,who,chat_id)
+
+    def default_chat_changed(self,user:User)->NoReturn:
+        with self._lock:
+            if self.storage is not None:
+                self.storage.default_chat_changed(user.username,user.default_chat)
+
+    def compact(self,storage:Storage)->NoReturn:
+        with self._lock:
+            storage.compact(lambda:[user.as_dict() for user in self._users.values()])
+
+    def _owner(self,chat_id:int)->Optional[User]:
+        entry:Optional[Tuple[User,Optional[str]]]=self._chats.get(chat_id)
+        return None if entry is None else entry[0]
+
+    def _reindex(self,user:User,chat_id:int)->NoReturn:
+        contacts:List[str]=[who for who,associated in user.associations.items() if associated==chat_id]
+        if len(contacts)>0:
+            self._chats[chat_id]=user,contacts[-1]
+        elif chat_id==user.default_chat_id:
+            self._chats[chat_id]=user,None
+        else:
+            self._chats.pop(chat_id,None)
+
+    def __contains__(self,username:int)->bool:
+        return username in self._users
+
+    def __iter__(self)->Iterator[User]:
+        with self._lock:
+            users:List[User]=list(self._users.values())
+        return iter(users)
+
+    def __len__(self)->int:
+        return len(self._users)
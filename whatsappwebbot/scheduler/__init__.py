@@ -0,0 +1 @@
+from ._scheduler import PollScheduler
@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor,Future
+from typing import Dict,Optional,NoReturn,Iterable
+from logging import Logger
+from time import monotonic
+from whatsappwebbot.user import User
+from whatsappwebbot.logs import USER
+from whatsapp import METRICS
+
+class _PollState:
+    def __init__(self,interval:float):
+        self.future:Optional[Future]=None
+        self.started:float=0
+        self.next_poll:float=0
+        self.interval:float=interval
+        self.duration:Optional[float]=None
+        self.late:bool=False
+
+class PollScheduler:
+    def __init__(self,workers:int,interval:float,max_interval:float,deadline:float,logger:Logger):
+        self.interval:float=interval
+        self.max_interval:float=max_interval
+        self.deadline:float=deadline
+        self.logger:Logger=logger
+        self._executor:ThreadPoolExecutor=ThreadPoolExecutor(max_workers=workers,thread_name_prefix='poll')
+        self._states:Dict[int,_PollState]={}
+
+    def poll(self,users:Iterable[User])->NoReturn:
+        now:float=monotonic()
+        states:Dict[int,_PollState]={}
+        for user in users:
+            state:_PollState=self._states.get(user.username) or _PollState(self.interval)
+            states[user.username]=state
+            if state.future is not None and not state.future.done():
+                if not state.late and now-state.started>self.deadline:
+                    state.late=True
+                    self.logger.warning(f'Poll of user {user.username} is taking more than {self.deadline}s')
+                continue
+            if now<state.next_poll:
+                continue
+            state.started=now
+            state.late=False
+            state.future=self._executor.submit(self._poll,user,state)
+        self._states=states
+
+    def _poll(self,user:User,state:_PollState)->NoReturn:
+        received:int=0
+        try:
+            received=user.receive_messages()
+        except Exception as e:
+            self.logger.error(f'Poll of user {user.username} failed: {e}',exc_info=True,extra={USER:user.username})
+        finished:float=monotonic()
+        state.duration=finished-state.started
+        METRICS.observe('poll',str(user.username),state.duration)
+        state.interval=self.interval if received>0 else min(state.interval*2,self.max_interval)
+        state.next_poll=finished+state.interval
+        self.logger.debug(f'Polled user {user.username} in {state.duration:.3f}s, '
+                          f'next poll in {state.interval:.1f}s',extra={USER:user.username})
+
+    def close(self)->NoReturn:
+        self._executor.shutdown(wait=True)
@@ -0,0 +1 @@
+from ._storage import Storage
@@ -0,0 +1,128 @@
+from typing import Dict,Any,List,NoReturn,Optional,TextIO,Callable
+from collections import OrderedDict
+from threading import Lock
+from logging import Logger
+from json import dump,dumps,load,loads
+from os import makedirs,replace,fsync,remove
+from os.path import exists,join
+from time import monotonic
+from whatsappwebbot.user import USERNAME,ASSOCIATIONS,DEFAULT_CHAT
+
+USERS='users'
+SNAPSHOT='data.json'
+JOURNAL='data.journal'
+TYPE='type'
+USER='user'
+WHO='who'
+CHAT_ID='chat_id'
+USER_ADDED='user_added'
+USER_DELETED='user_deleted'
+ASSOCIATION_SET='association_set'
+DEFAULT_CHAT_CHANGED='default_chat_changed'
+COMPACT_RETRY=60
+
+class Storage:
+    def __init__(self,data_dir:str,compact_every:int,compact_interval:float,logger:Logger):
+        self.data_dir:str=data_dir
+        self.compact_every:int=compact_every
+        self.compact_interval:float=compact_interval
+        self.logger:Logger=logger
+        self._lock:Lock=Lock()
+        self._journal:Optional[TextIO]=None
+        self._records:int=0
+        self._compacted:float=monotonic()
+        self._retry:float=0
+
+    snapshot_file:str=property(lambda self:join(self.data_dir,SNAPSHOT))
+    journal_file:str=property(lambda self:join(self.data_dir,JOURNAL))
+
+    @property
+    def due(self)->bool:
+        now:float=monotonic()
+        return now>=self._retry and (self._records>=self.compact_every or
+                                     (self._records>0 and now-self._compacted>=self.compact_interval))
+
+    def load(self)->List[Dict[str,Any]]:
+        users:'OrderedDict[int,Dict[str,Any]]'=OrderedDict()
+        if exists(self.snapshot_file):
+            with open(self.snapshot_file,'r') as f:
+                for user in load(f)[USERS]:
+                    users[user[USERNAME]]=user
+        replayed:int=0
+        if exists(self.journal_file):
+            with open(self.journal_file,'r') as f:
+                for line in f:
+                    try:
+                        entry:Dict[str,Any]=loads(line)
+                    except ValueError:
+                        self.logger.warning(f'Ignoring a truncated entry at the end of {self.journal_file}')
+                        break
+                    self._apply(users,entry)
+                    replayed+=1
+        self._records=replayed
+        self.logger.debug(f'Loaded {len(users)} users replaying {replayed} journal entries')
+        return list(users.values())
+
+    @staticmethod
+    def _apply(users:Dict[int,Dict[str,Any]],entry:Dict[str,Any])->NoReturn:
+        if entry[TYPE]==USER_ADDED:
+            users[entry[USER][USERNAME]]=entry[USER]
+        elif entry[TYPE]==USER_DELETED:
+            users.pop(entry[USERNAME],None)
+        elif entry[USERNAME] not in users:
+            return
+        elif entry[TYPE]==ASSOCIATION_SET:
+            users[entry[USERNAME]][ASSOCIATIONS][entry[WHO]]=entry[CHAT_ID]
+        elif entry[TYPE]==DEFAULT_CHAT_CHANGED:
+            users[entry[USERNAME]][DEFAULT_CHAT]=entry[DEFAULT_CHAT]
+
+    def user_added(self,user:Dict[str,Any])->NoReturn:
+        self._record({TYPE:USER_ADDED,USER:user})
+
+    def user_deleted(self,username:int)->NoReturn:
+        self._record({TYPE:USER_DELETED,USERNAME:username})
+
+    def association_set(self,username:int,who:str,chat_id:int)->NoReturn:
+        self._record({TYPE:ASSOCIATION_SET,USERNAME:username,WHO:who,CHAT_ID:chat_id})
+
+    def default_chat_changed(self,username:int,default_chat:str)->NoReturn:
+        self._record({TYPE:DEFAULT_CHAT_CHANGED,USERNAME:username,DEFAULT_CHAT:default_chat})
+
+    def _record(self,entry:Dict[str,Any])->NoReturn:
+        with self._lock:
+            if self._journal is None:
+                makedirs(self.data_dir,exist_ok=True)
+                self._journal=open(self.journal_file,'a')
+            self._journal.write(dumps(entry)+'\n')
+            self._journal.flush()
+            fsync(self._journal.fileno())
+            self._records+=1
+
+    def compact(self,snapshot:Callable[[],List[Dict[str,Any]]])->NoReturn:
+        with self._lock:
+            users:List[Dict[str,Any]]=snapshot()
+            temporary:str=self.snapshot_file+'.tmp'
+            try:
+                makedirs(self.data_dir,exist_ok=True)
+                with open(temporary,'w') as f:
+                    dump({USERS:users},f)
+                    f.flush()
+                    fsync(f.fileno())
+                replace(temporary,self.snapshot_file)
+            except Exception:
+                self._retry=monotonic()+min(self.compact_interval,COMPACT_RETRY)
+                if exists(temporary):
+                    remove(temporary)
+                raise
+            if self._journal is not None:
+                self._journal.close()
+            self._journal=open(self.journal_file,'w')
+            self._records=0
+            self._compacted=monotonic()
+        self.logger.debug(f'Compacted {len(users)} users into {self.snapshot_file}')
+
+    def close(self)->NoReturn:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal=None
@@ -1 +1,2 @@
-from ._user import User,USERNAME,DEFAULT_CHAT_ID,ASSOCIATIONS,DEFAULT_CHAT
+from ._user import User,USERNAME,DEFAULT_CHAT_ID,ASSOCIATIONS,DEFAULT_CHAT,LAST_ACTIVE,BROADCAST,SNAPSHOTS
+from ._outbox import Outbox,Delivery
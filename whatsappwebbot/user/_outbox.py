@@ -0,0 +1,93 @@
+from concurrent.futures import Future
+from collections import OrderedDict,deque
+from threading import Thread,Condition,Lock,current_thread
+from typing import Callable,NoReturn,Optional,List,Deque,Union,Tuple
+from logging import Logger,LoggerAdapter
+from whatsapp import MessageType
+
+class Delivery:
+    def __init__(self,message_type:MessageType,text:str,data:Optional[Union[bytes,str]]=None,
+                 recipients:Optional[List[str]]=None,photos:Optional[List[Tuple[Union[bytes,str],str]]]=None,
+                 progress:Optional[Callable[[str,Optional[Exception]],NoReturn]]=None):
+        self.message_type:MessageType=message_type
+        self.text:str=text
+        self.data:Optional[Union[bytes,str]]=data
+        self.recipients:Optional[List[str]]=recipients
+        self.photos:Optional[List[Tuple[Union[bytes,str],str]]]=photos
+        self.progress:Optional[Callable[[str,Optional[Exception]],NoReturn]]=progress
+        self.future:Future=Future()
+
+class Outbox:
+    def __init__(self,name:str,lock:Lock,send:Callable[[str,Delivery],NoReturn],
+                 logger:Union[Logger,LoggerAdapter],prepare:Optional[Callable[[],NoReturn]]=None):
+        self._lock:Lock=lock
+        self._send:Callable[[str,Delivery],NoReturn]=send
+        self._prepare:Optional[Callable[[],NoReturn]]=prepare
+        self.logger:Union[Logger,LoggerAdapter]=logger
+        self._pending:'OrderedDict[str,Deque[Delivery]]'=OrderedDict()
+        self._condition:Condition=Condition()
+        self._running:bool=True
+        self._flushing:bool=False
+        self._thread:Thread=Thread(target=self._run,name=f'{name}-outbox',daemon=True)
+        self._thread.start()
+
+    def put(self,who:str,delivery:Delivery)->Future:
+        with self._condition:
+            if not self._running:
+                raise RuntimeError('The outbox is closed')
+            self._pending.setdefault(who,deque()).append(delivery)
+            self._condition.notify()
+        return delivery.future
+
+    def _run(self)->NoReturn:
+        while True:
+            with self._condition:
+                while self._running and len(self._pending)==0:
+                    self._condition.wait()
+                if len(self._pending)==0:
+                    return
+                who,deliveries=self._pending.popitem(last=False)
+                self._flushing=True
+            try:
+                self._flush(who,list(deliveries))
+            finally:
+                self._flushing=False
+
+    @property
+    def idle(self)->bool:
+        with self._condition:
+            return not self._flushing and len(self._pending)==0
+
+    def _flush(self,who:str,deliveries:List[Delivery])->NoReturn:
+        self.logger.debug(f'Flushing {len(deliveries)} message/es to {who}')
+        if self._prepare is not None:
+            try:
+                self._prepare()
+            except Exception as e:
+                for delivery in deliveries:
+                    if delivery.future.set_running_or_notify_cancel():
+                        delivery.future.set_exception(e)
+                return
+        results:List[Tuple[Delivery,Optional[Exception]]]=[]
+        with self._lock:
+            for delivery in deliveries:
+                if not delivery.future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    self._send(who,delivery)
+                except Exception as e:
+                    results.append((delivery,e))
+                else:
+                    results.append((delivery,None))
+        for delivery,error in results:
+            if error is None:
+                delivery.future.set_result(who)
+            else:
+                delivery.future.set_exception(error)
+
+    def close(self)->NoReturn:
+        with self._condition:
+            self._running=False
+            self._condition.notify()
+        if current_thread() is not self._thread:
+            self._thread.join()
@@ -1,110 +1,282 @@
-from typing import Dict,Optional,Callable,NoReturn,List,Any
+from typing import Dict,Optional,Callable,NoReturn,List,Any,Union,Tuple
 from io import BytesIO
-from whatsapp import Whatsapp,Message,MessageType
+from whatsapp import Whatsapp,Message,MessageType,profile_size,compact_profile,snapshot_profile,restore_profile,\
+    remove_snapshot
 from os.path import join
-from whatsappwebbot.error import WhatsappUserNotFoundError
-from telegram.error import Unauthorized
+from whatsappwebbot.error import WhatsappUserNotFoundError,WhatsappNotLoggedInError
+from telegram.error import Unauthorized,TelegramError
+from telegram import Bot,InputMediaPhoto
 import telegram.message
 from shutil import rmtree
 from threading import Lock
+from logging import LoggerAdapter
+from time import time,monotonic
+from concurrent.futures import Future
+from ._outbox import Outbox,Delivery
+from whatsappwebbot.logs import USER
 
 USERNAME='username'
 DEFAULT_CHAT_ID='default_chat_id'
 ASSOCIATIONS='associations'
 DEFAULT_CHAT='default_chat'
+LAST_ACTIVE='last_active'
+BROADCAST='*'
+SNAPSHOTS='snapshots'
 
 class User:
     def __init__(self,whatsappwebbot,username:int,default_chat_id:int,associations:Dict[str,int]=None,
-                 default_chat:str=None):
+                 default_chat:str=None,start:bool=True,last_active:Optional[float]=None):
         self.username:int=username
         self.default_chat_id:int=default_chat_id
         self.current_mode: Optional[Callable[['User',Message], NoReturn]] = None
         self.associations:Dict[str,int]={} if associations is None else associations
         from whatsappwebbot import WhatsappWebBot
         self.whatsappwebbot: WhatsappWebBot = whatsappwebbot
-        self.whatsapp = Whatsapp(self.get_user_folder(), default_chat,whatsappwebbot.options)
-        self.whatsapp.qr_callback = self._create_callback()
+        self.logger:LoggerAdapter=LoggerAdapter(whatsappwebbot.logger,{USER:username})
+        self._default_chat:Optional[str]=default_chat
+        self._whatsapp:Optional[Whatsapp]=None
         self._lock:Lock=Lock()
+        self._session_lock:Lock=Lock()
+        self._deleted:bool=False
+        self.last_active:float=time() if last_active is None else last_active
+        self.session_started:Optional[float]=None
+        self.outbox:Outbox=Outbox(str(username),self._lock,self._deliver,self.logger,
+                                  lambda:self._ready(whatsappwebbot.options.login_timeout))
+        if start:
+            self.wake()
+
+    @property
+    def whatsapp(self)->Whatsapp:
+        return self.wake()
+
+    session:Optional[Whatsapp]=property(lambda self:self._whatsapp)
+    awake:bool=property(lambda self:self._whatsapp is not None)
+
+    def wake(self)->Whatsapp:
+        with self._session_lock:
+            if self._whatsapp is None:
+                self.logger.debug(f'Starting the session of user {self.username}')
+                self.session_started=time()
+                started:float=monotonic()
+                self._whatsapp=Whatsapp(self.get_user_folder(),self._default_chat,self.whatsappwebbot.options,
+                                        self.whatsappwebbot.pool,self.whatsappwebbot.staging)
+                self._whatsapp.qr_callback=self._create_callback()
+                self.whatsappwebbot.logs.attach(self._whatsapp.logger)
+                self.logger.info(f'Session of user {self.username} started in '
+                                 f'{monotonic()-started:.1f}s')
+            return self._whatsapp
+
+    def hibernate(self)->bool:
+        with self._lock,self._session_lock:
+            if not self._stop_session():
+                return False
+            if self.whatsappwebbot.options.compact_on_hibernate:
+                self._compact()
+            return True
+
+    def _stop_session(self)->bool:
+        if self._whatsapp is None:
+            return False
+        self.logger.debug(f'Stopping the session of user {self.username}')
+        self._default_chat=self._whatsapp.default_chat
+        self._whatsapp.close()
+        self._whatsapp=None
+        return True
+
+    def _compact(self)->int:
+        freed:int=compact_profile(self.get_user_folder())
+        self.logger.debug(f'Profile of user {self.username} compacted, {freed} bytes freed')
+        return freed
+
+    def compact_profile(self)->Tuple[int,int,Optional[float],Optional[float]]:
+        with self._lock,self._session_lock:
+            startup:Optional[float]=None if self._whatsapp is None else self._whatsapp.login_time
+            restart:bool=self._stop_session()
+            before:int=profile_size(self.get_user_folder())
+            self._compact()
+            after:int=profile_size(self.get_user_folder())
+        return before,after,startup,self._ready().login_time if restart else None
+
+    def snapshot_file(self)->str:
+        return join(self.whatsappwebbot.data_dir,SNAPSHOTS,f'{self.username}.tar.gz')
+
+    def snapshot(self)->int:
+        with self._lock,self._session_lock:
+            restart:bool=self._stop_session()
+            size:int=snapshot_profile(self.get_user_folder(),self.snapshot_file())
+        self.logger.info(f'Snapshot of user {self.username} taken, {size} bytes')
+        if restart:
+            self.wake()
+        return size
+
+    def restore_snapshot(self)->Optional[float]:
+        with self._lock,self._session_lock:
+            restart:bool=self._stop_session()
+            restore_profile(self.snapshot_file(),self.get_user_folder())
+        self.logger.info(f'Profile of user {self.username} restored from its snapshot')
+        return self._ready().login_time if restart else None
+
+    def touch(self)->NoReturn:
+        self.last_active=time()
+
+    def _ready(self,timeout:Optional[float]=None)->Whatsapp:
+        whatsapp:Whatsapp=self.wake()
+        whatsapp.wait_for_login(timeout)
+        if not whatsapp.logged_in:
+            raise WhatsappNotLoggedInError(self.username)
+        return whatsapp
 
     @property
     def default_chat(self)->str:
-        return self.whatsapp.default_chat
+        return self._default_chat if self._whatsapp is None else self._whatsapp.default_chat
 
     @default_chat.setter
     def default_chat(self,default_chat:str)->NoReturn:
-        self.whatsapp.default_chat=default_chat
+        self._ready().default_chat=default_chat
+        self._default_chat=default_chat
+        self.whatsappwebbot.users.default_chat_changed(self)
 
     def _create_callback(self)->Callable[[bytes],NoReturn]:
+        sent:Optional[telegram.message.Message]=None
+
         def method(image:bytes):
-            self.whatsappwebbot.updater.bot.send_photo(self.default_chat_id,BytesIO(image))
+            nonlocal sent
+            bot:Bot=self.whatsappwebbot.updater.bot
+            if self.whatsappwebbot.options.qr_edit and sent is not None:
+                try:
+                    bot.edit_message_media(chat_id=self.default_chat_id,message_id=sent.message_id,
+                                           media=InputMediaPhoto(BytesIO(image)))
+                    return
+                except TelegramError as e:
+                    self.logger.debug(f'Editing the QR code of user {self.username} failed: {e}')
+            sent=bot.send_photo(self.default_chat_id,BytesIO(image))
         return method
 
     def add_association(self,who:str,chat:int)->NoReturn:
-        if not self.whatsapp.user_exists(who):
+        if not self._ready().user_exists(who):
             raise WhatsappUserNotFoundError(who)
-        self.associations[who]=chat
+        self.whatsappwebbot.users.associate(self,who,chat)
 
-    def receive_messages(self):
-        if not self.whatsapp.logged_in:
-            return
+    def receive_messages(self)->int:
         with self._lock:
-            messages: List[Message] = self.whatsapp.get_unread_messages()
+            whatsapp:Optional[Whatsapp]=self._whatsapp
+            if whatsapp is None or not whatsapp.logged_in:
+                return 0
+            messages: List[Message] = whatsapp.get_unread_messages()
+            if len(messages)==0:
+                whatsapp.return_to_default_chat(self.whatsappwebbot.options.idle_chat_timeout)
+            errors:Dict[str,Exception]=whatsapp.fetch_media([message.media for message in messages
+                                                             if message.media is not None])
         if len(messages) > 0:
-            self.whatsappwebbot.logger.debug(f'User {self.username} has received {len(messages)} message/es')
+            self.touch()
+            self.logger.debug(f'User {self.username} has received {len(messages)} message/es')
         for message in messages:
-            text: str = ''
-            chat_id: int = self.default_chat_id
-            if message.sender not in self.associations:
-                text = f'{message.sender}: '
-            else:
-                chat_id = self.associations[message.sender]
-            if message.who is not None:
-                text += f'{message.who}: '
             try:
-                if message.message_type == MessageType.TEXT:
-                    self.whatsappwebbot.updater.bot.send_message(chat_id, text + message.message)
-                elif message.message_type == MessageType.AUDIO:
-                    self.whatsappwebbot.updater.bot.send_audio(chat_id, BytesIO(message.message), caption=text)
-                elif message.message_type == MessageType.IMAGE:
-                    caption, data = message.message
-                    self.whatsappwebbot.updater.bot.send_photo(chat_id, BytesIO(data), caption=text + caption)
-                else:
-                    raise NotImplementedError(f'Message type {message.message_type.name} not supported')
-            except Unauthorized:
-                self.delete_user()
-            print(message)
-
-    def send_message(self,chat_id:int,message:str):
-        self._send_message(chat_id,message,MessageType.TEXT)
-
-    def send_photo(self,chat_id:int,photo:bytes,caption:str):
-        self._send_message(chat_id,caption,MessageType.IMAGE,photo)
-
-    def _send_message(self,chat_id:int,text:str,message_type:MessageType,data:bytes=None):
-        who: Optional[str] = None
-        for key in self.associations.keys():
-            if self.associations[key] == chat_id:
-                who = key
+                if message.media is not None and message.media.url in errors:
+                    raise errors[message.media.url]
+                self._forward(message)
+            except Exception as e:
+                self.logger.error(f'Forwarding {message.message_type.name} from {message.sender} to '
+                                  f'{self.username} failed: {e}',exc_info=True)
+        return len(messages)
+
+    def _forward(self,message:Message)->NoReturn:
+        text: str = ''
+        chat_id: Optional[int] = self.associations.get(message.sender)
+        if chat_id is None:
+            chat_id = self.default_chat_id
+            text = f'{message.sender}: '
+        if message.who is not None:
+            text += f'{message.who}: '
+        future:Future
+        if message.message_type == MessageType.TEXT:
+            future=self.whatsappwebbot.egress.send_message(chat_id, text + message.text, self.username)
+        elif message.message_type == MessageType.AUDIO:
+            future=self.whatsappwebbot.egress.send_audio(chat_id, self._read_media(message), text,
+                                                         self.username)
+        elif message.message_type == MessageType.IMAGE:
+            future=self.whatsappwebbot.egress.send_photo(chat_id, self._read_media(message),
+                                                         text + message.text, self.username)
+        else:
+            raise NotImplementedError(f'Message type {message.message_type.name} not supported')
+        future.add_done_callback(self._forwarded)
+        self.logger.debug(f'Forwarding {message.message_type.name} from {message.sender} to {self.username}')
+
+    def _read_media(self,message:Message)->bytes:
+        if message.media.loaded:
+            data:bytes=message.media.read()
+        else:
+            with self._lock:
+                data:bytes=message.media.read()
+        message.media.release()
+        return data
+
+    def _forwarded(self,future:Future)->NoReturn:
+        exception:Optional[BaseException]=future.exception()
+        if isinstance(exception,Unauthorized):
+            self.delete_user()
+        elif exception is not None:
+            self.logger.error(f'Forwarding to {self.username} failed: {exception}',
+                              exc_info=exception)
+
+    def send_message(self,chat_id:int,message:str)->Future:
+        return self._send_message(chat_id,message,MessageType.TEXT)
+
+    def send_photo(self,chat_id:int,photo:Union[bytes,str],caption:str)->Future:
+        return self._send_message(chat_id,caption,MessageType.IMAGE,photo)
+
+    def broadcast(self,recipients:List[str],text:str,
+                  progress:Optional[Callable[[str,Optional[Exception]],NoReturn]]=None)->Future:
+        self.logger.debug(f'User {self.username} queued a broadcast to {len(recipients)} recipients')
+        return self.outbox.put(BROADCAST,Delivery(MessageType.TEXT,text,recipients=recipients,progress=progress))
+
+    def send_photos(self,chat_id:int,photos:List[Tuple[Union[bytes,str],str]])->Future:
+        if len(photos)==0:
+            raise ValueError('No photos to send')
+        who,caption=self._recipient(chat_id,photos[0][1])
+        photos=[(photos[0][0],caption)]+photos[1:]
+        self.logger.debug(f'User {self.username} queued an album of {len(photos)} photos to {who}')
+        return self.outbox.put(who,Delivery(MessageType.IMAGE,caption,photos=photos))
+
+    def _send_message(self,chat_id:int,text:str,message_type:MessageType,
+                      data:Optional[Union[bytes,str]]=None)->Future:
+        who,text=self._recipient(chat_id,text)
+        self.logger.debug(f'User {self.username} queued {message_type.name} to {who}')
+        return self.outbox.put(who,Delivery(message_type,text,data))
+
+    def _recipient(self,chat_id:int,text:str)->Tuple[str,str]:
+        who: Optional[str] = self.whatsappwebbot.users.contact(self,chat_id)
         if who is None:
             who = text.split(' ')[0]
             text = text[len(who) + 1:]
-        self.whatsappwebbot.logger.debug(f'User {self.username} sent {message_type.name} to {who}')
-        with self._lock:
-            if message_type == MessageType.TEXT:
-                self.whatsapp.send_message(who, text)
-            elif message_type == MessageType.IMAGE:
-                self.whatsapp.send_photo(who, data, text)
-            else:
-                raise NotImplementedError(f'{message_type.name} not implemented yet')
+        return who,text
+
+    def _deliver(self,who:str,delivery:Delivery)->NoReturn:
+        whatsapp:Optional[Whatsapp]=self._whatsapp
+        if whatsapp is None or not whatsapp.logged_in:
+            raise WhatsappNotLoggedInError(self.username)
+        self.touch()
+        if delivery.recipients is not None:
+            whatsapp.send_many(delivery.recipients, delivery.text, delivery.progress)
+        elif delivery.photos is not None:
+            whatsapp.send_photos(who, delivery.photos)
+        elif delivery.message_type == MessageType.TEXT:
+            whatsapp.send_message(who, delivery.text)
+        elif delivery.message_type == MessageType.IMAGE:
+            whatsapp.send_photo(who, delivery.data, delivery.text)
+        else:
+            raise NotImplementedError(f'{delivery.message_type.name} not implemented yet')
+        self.logger.debug(f'User {self.username} sent {delivery.message_type.name} to {who}')
 
     def as_dict(self)->Dict[str,Any]:
         return {USERNAME:self.username,DEFAULT_CHAT_ID:self.default_chat_id,
-                ASSOCIATIONS:self.associations,DEFAULT_CHAT:self.whatsapp.default_chat}
+                ASSOCIATIONS:dict(self.associations),DEFAULT_CHAT:self.default_chat,LAST_ACTIVE:self.last_active}
 
     def __repr__(self)->str:
         data:Dict[str,Any]=self.as_dict()
         del data[DEFAULT_CHAT]
         del data[ASSOCIATIONS]
+        del data[LAST_ACTIVE]
         return str(data)
 
     def log(self,message:str):
@@ -113,6 +285,11 @@ class User:
         except Unauthorized:
             self.delete_user()
 
+    def post(self,message:str)->Future:
+        future:Future=self.whatsappwebbot.egress.send_message(self.default_chat_id,message,self.username)
+        future.add_done_callback(self._forwarded)
+        return future
+
     def log_error(self,exception:Exception):
         self.whatsappwebbot.log_error(exception,self.default_chat_id)
 
@@ -129,11 +306,17 @@ class User:
         return join(self.whatsappwebbot.data_dir, str(self.username))
 
     def delete_user(self):
-        self.whatsappwebbot.logger.debug(f'Deleting user {self.username}')
-        self.whatsapp.close()
+        if self._deleted:
+            return
+        self._deleted=True
+        self.logger.debug(f'Deleting user {self.username}')
+        self.outbox.close()
+        self.hibernate()
         self.whatsappwebbot.users.remove(self)
         rmtree(self.get_user_folder(),ignore_errors=True)
         rmtree(self.get_user_folder(), ignore_errors=True)
+        remove_snapshot(self.snapshot_file())
 
     def close(self)->NoReturn:
-        self.whatsapp.close()
+        self.outbox.close()
+        self.hibernate()